@@ -0,0 +1,343 @@
+"""
+Micro-benchmarks for the hot functions of "boderdetect & metadata V2.py".
+
+A deterministic generator synthesizes a corpus of JPEG, PNG and TIFF images
+(plain, black/white borders, alpha, near-duplicates and large metadata
+blocks) at several resolutions; every function is timed on it and its
+latency and throughput are reported. Save a run with --json and check a
+later one against it with --compare to catch regressions before a release.
+
+    python benchmark.py [--quick] [--repeat N] [--json out.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import importlib.util
+
+import cv2
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "boderdetect & metadata V2.py")
+
+SIZES = [(640, 480), (1920, 1280), (4000, 3000)]
+QUICK_SIZES = SIZES[:2]
+SEED = 20240601
+DEFAULT_TOLERANCE = 0.20  # --compare flags cases whose median got more than this much slower...
+MIN_REGRESSION_MS = 0.5   # ...and by at least this much, so timer noise on sub-millisecond calls is ignored
+
+
+def load_app():
+    """Import the application script (its file name is not a valid module name)"""
+    spec = importlib.util.spec_from_file_location("borderdetect_app", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ===== Synthetic corpus =====
+def synth_photo(rng, width, height):
+    """Smooth random colour field plus grain, so it compresses and hashes like a photo"""
+    base = rng.integers(0, 256, (max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+    img = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC).astype(np.int16)
+    img += rng.integers(-4, 5, (height, width, 3), dtype=np.int16)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def add_border(img, value):
+    """Flat border of the given grey level on all four sides (8% of each side, above the 5% margin checked)"""
+    img = img.copy()
+    h, w = img.shape[:2]
+    mh, mw = max(int(h * 0.08), 12), max(int(w * 0.08), 12)
+    img[:mh] = value
+    img[-mh:] = value
+    img[:, :mw] = value
+    img[:, -mw:] = value
+    return img
+
+
+def near_duplicate(img):
+    """Copy downscaled to 90%, as a smaller re-export of the same shot would be"""
+    h, w = img.shape[:2]
+    return cv2.resize(img, (w * 9 // 10, h * 9 // 10), interpolation=cv2.INTER_AREA)
+
+
+def with_alpha(img):
+    """BGRA copy that is transparent outside a centred ellipse"""
+    h, w = img.shape[:2]
+    alpha = np.zeros((h, w), dtype=np.uint8)
+    cv2.ellipse(alpha, (w // 2, h // 2), (w * 2 // 5, h * 2 // 5), 0, 0, 360, 255, -1)
+    return np.dstack([img, alpha])
+
+
+def metadata_blob(rng, size):
+    """Printable filler of the given size for metadata fields"""
+    return ''.join(chr(c) for c in rng.integers(0x20, 0x7F, size))
+
+
+def save_image(img, path, rng, metadata=False):
+    """Save a BGR(A) image by extension, with large EXIF/ICC, text chunks or TIFF tags if metadata=True"""
+    channels = img.shape[2]
+    pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA if channels == 4 else cv2.COLOR_BGR2RGB))
+    ext = os.path.splitext(path)[1].lower()
+    
+    if ext == '.jpg':
+        options = {'quality': 90}
+        if metadata:
+            exif = Image.Exif()
+            exif[0x010E] = metadata_blob(rng, 48 * 1024)  # ImageDescription
+            exif[0x013B] = "Benchmark Artist"               # Artist
+            exif[0x0112] = 1                                # Orientation
+            options['exif'] = exif.tobytes()
+            options['icc_profile'] = rng.integers(0, 256, 16 * 1024, dtype=np.uint8).tobytes()
+            options['comment'] = metadata_blob(rng, 4 * 1024)
+        pil_img.save(path, 'JPEG', **options)
+    elif ext == '.png':
+        options = {'compress_level': 6}
+        if metadata:
+            info = PngImagePlugin.PngInfo()
+            info.add_text('Description', metadata_blob(rng, 32 * 1024))
+            info.add_itxt('XML:com.adobe.xmp', metadata_blob(rng, 32 * 1024))
+            options['pnginfo'] = info
+        pil_img.save(path, 'PNG', **options)
+    else:
+        options = {'compression': 'tiff_lzw'}
+        if metadata:
+            options['tiffinfo'] = {270: metadata_blob(rng, 48 * 1024), 315: "Benchmark Artist"}
+        pil_img.save(path, 'TIFF', **options)
+
+
+# (kind, extension, metadata): every kind is generated at every size
+CORPUS_SPEC = [
+    ('photo', '.jpg', False),
+    ('exif', '.jpg', True),
+    ('near_dup', '.jpg', False),
+    ('black', '.jpg', False),
+    ('white', '.jpg', False),
+    ('photo', '.png', True),
+    ('alpha', '.png', False),
+    ('white', '.png', False),
+    ('photo', '.tif', True),
+    ('black', '.tif', False),
+]
+
+
+# Label of the metadata each format carries when saved with metadata=True
+METADATA_LABELS = {'.jpg': 'exif', '.png': 'text', '.tif': 'tags'}
+
+
+def make_corpus(folder, sizes, seed=SEED):
+    """
+    Write the synthetic corpus into folder. The same seed always produces the same images.
+    Every image without metadata also gets a metadata-bearing twin (in folder/metadata),
+    so metadata removal can be timed on files that actually have something to strip.
+    Returns: list of (path, size name, kind, extension, has metadata, metadata twin path)
+    """
+    os.makedirs(folder, exist_ok=True)
+    twin_folder = os.path.join(folder, "metadata")
+    os.makedirs(twin_folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    # Twins draw from their own generator so the main corpus stays the same for a seed
+    twin_rng = np.random.default_rng(seed + 1)
+    corpus = []
+    for width, height in sizes:
+        size_name = f"{width}x{height}"
+        photo = synth_photo(rng, width, height)
+        images = {
+            'photo': photo,
+            'exif': photo,
+            'near_dup': near_duplicate(photo),
+            'black': add_border(synth_photo(rng, width, height), 0),
+            'white': add_border(synth_photo(rng, width, height), 255),
+            'alpha': with_alpha(synth_photo(rng, width, height)),
+        }
+        for kind, ext, metadata in CORPUS_SPEC:
+            path = os.path.join(folder, f"{size_name}_{kind}{ext}")
+            save_image(images[kind], path, rng, metadata)
+            twin = path
+            if not metadata:
+                twin = os.path.join(twin_folder, f"{size_name}_{kind}_{METADATA_LABELS[ext]}{ext}")
+                save_image(images[kind], twin, twin_rng, True)
+            corpus.append((path, size_name, kind, ext, metadata, twin))
+    return corpus
+
+
+# ===== Timing =====
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def time_calls(calls, repeat, setup=None):
+    """
+    Time each (func, args) in calls, repeat times, after one untimed warm-up pass.
+    setup(args) runs before every call and is not timed.
+    Returns: list of per-call durations in seconds
+    """
+    timings = []
+    for round_index in range(repeat + 1):
+        for func, args in calls:
+            if setup:
+                setup(args)
+            start = time.perf_counter()
+            func(*args)
+            elapsed = time.perf_counter() - start
+            if round_index:
+                timings.append(elapsed)
+    return timings
+
+
+def summarize(function, case, timings, total_bytes=0):
+    """Latency percentiles and throughput of one benchmark case"""
+    values = sorted(timings)
+    total = sum(values)
+    return {
+        'function': function,
+        'case': case,
+        'calls': len(values),
+        'median_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'calls_per_second': len(values) / total if total else 0.0,
+        'mb_per_second': total_bytes / total / 1e6 if total and total_bytes else None,
+    }
+
+
+def run_benchmarks(app, corpus, repeat, scratch):
+    """Time every hot function on the corpus, grouped by resolution (and file format for metadata removal)"""
+    results = []
+    
+    def record(function, case, timings, paths=()):
+        total_bytes = sum(os.path.getsize(p) for p in paths) * repeat
+        results.append(summarize(function, case, timings, total_bytes))
+        row = results[-1]
+        print(f"  {function:<36} {case:<16} {row['median_ms']:9.2f} ms  {row['calls_per_second']:9.1f} /s")
+    
+    by_size = {}
+    for path, size_name, kind, ext, metadata, twin in corpus:
+        by_size.setdefault(size_name, []).append((path, kind, ext, metadata, twin))
+    
+    for size_name, files in by_size.items():
+        paths = [path for path, _, _, _, _ in files]
+        
+        record('prepare_image', size_name,
+               time_calls([(app.prepare_image, (p,)) for p in paths], repeat), paths)
+        record('prepare_image(analysis=True)', size_name,
+               time_calls([(app.prepare_image, (p, True)) for p in paths], repeat), paths)
+        
+        # Pure compute: decode once outside the timed calls
+        analysis_images = [(p, app.prepare_image(p, analysis=True)[0]) for p in paths]
+        full_images = [app.prepare_image(p)[0] for p in paths]
+        
+        record('detect_border_standalone', size_name,
+               time_calls([(app.detect_border_standalone, (img,)) for _, img in analysis_images], repeat))
+        
+        index = app.HashIndex({p: app.compute_phash(img) for p, img in analysis_images})
+        record('check_duplicate_standalone', size_name,
+               time_calls([(app.check_duplicate_standalone, (img, p, index)) for p, img in analysis_images], repeat))
+        
+        # resize_image doesn't use the instance, so it is timed without building the Tk window
+        resize = app.AdobeStockChecker.resize_image
+        record('resize_image(100x75)', size_name,
+               time_calls([(resize, (None, img, 100, 75)) for img in full_images], repeat))
+        record('resize_image(400x200)', size_name,
+               time_calls([(resize, (None, img, 400, 200)) for img in full_images], repeat))
+        
+        record('check_image_standalone', size_name,
+               time_calls([(app.check_image_standalone, (p, 0)) for p in paths], repeat), paths)
+        
+        # Metadata removal rewrites the file, so each call gets a fresh copy (copying is not timed).
+        # Files without metadata (nearly a plain copy) and with metadata are separate cases.
+        for ext in ('.jpg', '.png', '.tif'):
+            plain = [path for path, _, file_ext, metadata, _ in files if file_ext == ext and not metadata]
+            tagged = [twin for _, _, file_ext, _, twin in files if file_ext == ext]
+            for suffix, originals in (('', plain), ('+' + METADATA_LABELS[ext], tagged)):
+                sources = {os.path.join(scratch, os.path.basename(p)): p for p in originals}
+                
+                def restore(args, sources=sources):
+                    shutil.copyfile(sources[args[0]], args[0])
+                
+                record(f'remove_metadata_from_file{ext}{suffix}', size_name,
+                       time_calls([(app.remove_metadata_from_file, (p,)) for p in sources], repeat, setup=restore),
+                       originals)
+    
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Compare median latencies with a saved run; cases missing from it are not checked.
+    Returns: list of (function, case, baseline ms, current ms) that got slower than tolerance allows
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['function'], r['case']): r for r in json.load(f)['results']}
+    
+    regressions = []
+    for row in results:
+        old = baseline.get((row['function'], row['case']))
+        if (old and row['median_ms'] > old['median_ms'] * (1 + tolerance) and
+                row['median_ms'] - old['median_ms'] >= MIN_REGRESSION_MS):
+            regressions.append((row['function'], row['case'], old['median_ms'], row['median_ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for BorderDetect & Metadata")
+    parser.add_argument('--quick', action='store_true', help=f"skip the largest resolution ({SIZES[-1][0]}x{SIZES[-1][1]})")
+    parser.add_argument('--repeat', type=int, default=5, help="timed passes over the corpus (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=SEED, help="corpus generator seed (default: %(default)s)")
+    parser.add_argument('--corpus', help="write the corpus to this folder and keep it (default: a temporary folder)")
+    parser.add_argument('--json', help="save the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', help="fail if a case is slower than in this saved JSON run")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown for --compare, as a fraction (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    app = load_app()
+    sizes = QUICK_SIZES if args.quick else SIZES
+    work_dir = tempfile.mkdtemp(prefix="borderdetect-bench-")
+    corpus_dir = args.corpus or os.path.join(work_dir, "corpus")
+    scratch = os.path.join(work_dir, "scratch")
+    os.makedirs(scratch)
+    
+    try:
+        print(f"Generating corpus in {corpus_dir} (seed {args.seed})")
+        corpus = make_corpus(corpus_dir, sizes, args.seed)
+        # Metadata twins are timed too, so they count towards the corpus size
+        files = {path for path, *_, twin in corpus} | {twin for *_, twin in corpus}
+        print(f"Timing {len(files)} images x {args.repeat} passes")
+        results = run_benchmarks(app, corpus, max(1, args.repeat), scratch)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'seed': args.seed,
+                'sizes': [f"{w}x{h}" for w, h in sizes],
+                'repeat': args.repeat,
+                'python': platform.python_version(),
+                'opencv': cv2.__version__,
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'results': results
+            }, f, indent=2)
+        print(f"Results saved to {args.json}")
+    
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for function, case, old_ms, new_ms in regressions:
+            print(f"REGRESSION {function} {case}: {old_ms:.2f} ms -> {new_ms:.2f} ms")
+        if regressions:
+            return 1
+        print(f"No case is more than {args.tolerance:.0%} slower than {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
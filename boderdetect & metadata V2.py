@@ -8,9 +8,18 @@ import queue
 import time
 import math
 import shutil
+import tempfile
 import datetime
 import re
+import struct
+import sys
+import argparse
+import hashlib
+import sqlite3
+import json
 from math import gcd
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
 
 # Image processing libraries
 import cv2
@@ -18,13 +27,31 @@ import numpy as np
 from PIL import Image, ImageTk
 import imagehash
 import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 
 # ===== Duplicate Detection Settings =====
 # Based on PhotoSweep's proven approach
 HASH_SIZE = 16  # Larger = more accurate (PhotoSweep uses 16)
 SIMILARITY_THRESHOLD = 5  # Hamming distance threshold (lower = stricter, was 10)
 
+# ===== Processing Settings =====
+IN_FLIGHT_PER_WORKER = 2  # Tasks queued ahead per worker process so no worker waits for the next image
+ANALYSIS_MIN_SIDE = 1024  # Reduced analysis decode keeps at least this many pixels on the long side
+PREVIEW_SIZE = (800, 450)  # Live preview panes; workers return previews fitted to this size
+CACHE_FILENAME = '.borderdetect_cache.sqlite'  # Analysis cache kept in the working folder
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+FILE_WORKERS = 4  # Threads that move files and strip metadata in parallel
+FILE_QUEUE_SIZE = 256  # Classified images waiting to be moved before the scanner is held back
+UI_REFRESH_MS = 100  # Progress, live previews and category thumbnails are redrawn at most this often (10 Hz)
+CATEGORY_THUMBNAIL_SIZE = (400, 200)  # Last-image thumbnail of each category panel
+GALLERY_THUMBNAIL_SIZE = (100, 75)  # Flat gallery grid
+GROUP_THUMBNAIL_SIZE = (100, 80)  # Duplicate groups in the gallery
+CATEGORY_GROUP_THUMBNAIL_SIZE = (120, 90)  # Group views of the category tabs
+THUMBNAIL_CACHE_BYTES = 64 << 20  # Decoded thumbnails kept in memory across gallery views (least recently used are dropped)
+GALLERY_MARGIN_ROWS = 2  # Gallery rows built above and below the viewport so scrolling does not show empty cells
+GALLERY_LOADERS = 6  # Threads loading gallery thumbnails (on-screen cells first)
+SCAN_THUMBNAIL_SIZES = (CATEGORY_THUMBNAIL_SIZE, GROUP_THUMBNAIL_SIZE, GALLERY_THUMBNAIL_SIZE)  # Made by the workers during a scan, largest first
+
 # ===== Helper function for Unicode path support =====
 def imread_unicode(filepath, flags=cv2.IMREAD_COLOR):
     """
@@ -41,6 +68,73 @@ def imread_unicode(filepath, flags=cv2.IMREAD_COLOR):
         print(f"Error reading {filepath}: {e}")
         return None
 
+
+# ===== Directory enumeration =====
+def scan_images(folder, recursive=False, skip_dirs=(), extensions=IMAGE_EXTENSIONS):
+    """
+    Yield an os.DirEntry for each image file in folder while the directory is
+    still being read. os.scandir returns the file type with the listing (and
+    on Windows the size and mtime too), so there is no extra stat per file.
+    
+    Args:
+        folder: folder to scan
+        recursive: also walk subfolders (hidden ones are skipped)
+        skip_dirs: names of folders directly in folder not to walk into
+        extensions: lowercase file extensions to yield
+    """
+    pending = [folder]
+    while pending:
+        current = pending.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError as e:
+            print(f"Error reading folder {current}: {e}")
+            continue
+        
+        subfolders = []
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not entry.name.startswith('.') and not (current == folder and entry.name in skip_dirs):
+                            subfolders.append(entry.path)
+                    elif entry.name.lower().endswith(extensions) and entry.is_file():
+                        yield entry
+                except OSError:
+                    continue
+        
+        # Walk subfolders in name order after the files of this folder
+        pending.extend(sorted(subfolders, reverse=True))
+
+
+def reserve_path(folder, filename):
+    """
+    Like unique_path(), but creates the chosen file (empty) with an exclusive
+    open, so threads moving files in parallel never pick the same name.
+    """
+    name, ext = os.path.splitext(filename)
+    counter = 0
+    while True:
+        dest_path = os.path.join(folder, f"{name}_{counter}{ext}" if counter else filename)
+        try:
+            fd = os.open(dest_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            counter += 1
+            continue
+        os.close(fd)
+        return dest_path
+
+
+def unique_path(folder, filename):
+    """Path for filename in folder, adding _1, _2, ... to the name if it is already taken"""
+    dest_path = os.path.join(folder, filename)
+    name, ext = os.path.splitext(filename)
+    counter = 1
+    while os.path.exists(dest_path):
+        dest_path = os.path.join(folder, f"{name}_{counter}{ext}")
+        counter += 1
+    return dest_path
+
 class AdobeStockChecker:
     def __init__(self, root):
         self.root = root
@@ -52,12 +146,19 @@ class AdobeStockChecker:
         self.root.geometry("1680x945")
         
         # Store image hashes for duplicate detection
-        self.image_hashes = {}
+        self.hash_index = HashIndex()
+        
+        # Persistent analysis results of the selected folder (opened in select_folder)
+        self.analysis_cache = None
+        self._library_seeded = False
         
-        # Processing queues
-        self.left_queue = queue.Queue()
-        self.right_queue = queue.Queue()
-        self.result_queue = queue.Queue()
+        # Folder scan state (the scan streams files into work_queue in the background)
+        self.scan_done = threading.Event()
+        self.scan_done.set()
+        self._scan_generation = 0
+        
+        # Processing queues (one shared work queue; the left/right panes just show completed results)
+        self.work_queue = queue.Queue()
         
         # Processing state
         self.processing = False
@@ -66,6 +167,11 @@ class AdobeStockChecker:
         self.selected_folder = None
         self.start_time = None
         
+        # Per-stage timings, live rate and per-category counts of the current run
+        self.stage_timer = StageTimer()
+        self.rate_meter = RateMeter()
+        self.run_categories = {}
+        
         # Keep track of the last processed image per category
         self.last_processed = {
             'Good': None,
@@ -82,33 +188,51 @@ class AdobeStockChecker:
             'duplicate': 'Duplicate'
         }
         
+        # Images per category folder, kept up to date from the results and file operations
+        # (recounted from disk by reconcile_category_counts only when a folder is opened or a run ends)
+        self.category_counts = {name: 0 for name in self.categories.values()}
+        
         # Storage for each category manager
         self.category_managers = {
-            'Good': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'current_group': [], 'preview_index': 0},
-            'Black': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'current_group': [], 'preview_index': 0},
-            'White': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'current_group': [], 'preview_index': 0},
-            'Duplicate': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'current_group': [], 'preview_index': 0}
+            'Good': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'items': [], 'current_group': [], 'preview_index': 0},
+            'Black': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'items': [], 'current_group': [], 'preview_index': 0},
+            'White': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'items': [], 'current_group': [], 'preview_index': 0},
+            'Duplicate': {'groups': {}, 'selected': set(), 'checkboxes': {}, 'items': [], 'current_group': [], 'preview_index': 0}
         }
         
         # Current gallery category
         self.current_gallery_category = None
         
-        # Thumbnail cache for speed
-        self._thumbnail_cache = {}
+        # Decoded thumbnails for speed (bounded; the analysis cache keeps them on disk)
+        self._thumbnail_cache = ThumbnailLRU()
+        self._gallery_file_stats = {}  # path -> os.stat of the files in the open gallery
         
         # Create UI
         self.create_ui()
         
-        # Start result processing thread
-        threading.Thread(target=self.process_results, daemon=True).start()
+        # File operation stage: moves + metadata removal on its own thread pool, behind a bounded queue
+        self.file_stage = FileOpStage(self.process_result, workers=FILE_WORKERS, max_queue=FILE_QUEUE_SIZE)
         
         # Multiprocessing setup
         self.num_cores = max(1, multiprocessing.cpu_count() - 1)
+        self.in_flight_per_worker = IN_FLIGHT_PER_WORKER
         self.executor = None
         
         # Thread locks for thread safety
-        self.hash_lock = threading.Lock()
         self.progress_lock = threading.Lock()
+        self._dispatcher = None
+        self._dispatch_lock = threading.Lock()  # Start and the dispatcher's exit decide under it who runs the queue
+        
+        # Coalesced UI updates: processing threads only leave the latest state here,
+        # and _refresh_ui draws it on the Tk thread every UI_REFRESH_MS
+        self._ui_lock = threading.Lock()
+        self._pending_previews = {}    # panel position -> latest preview (JPEG bytes, image, or path of a cached file)
+        self._pending_thumbnails = {}  # category name -> latest preview (same)
+        self._ui_dirty = set()         # 'progress' and/or 'counts'
+        # Results answered from the cache carry no preview; the one that gets drawn is decoded here
+        self._preview_loader = ThreadPoolExecutor(max_workers=1)
+        self._preview_loading = set()  # ('pane', position) / ('category', name) being decoded
+        self.root.after(UI_REFRESH_MS, self._refresh_ui)
     
     def create_ui(self):
         """Create the user interface - single tab with gallery functionality"""
@@ -153,6 +277,33 @@ class AdobeStockChecker:
         )
         self.start_btn.pack(side=LEFT, padx=5)
         
+        # Incremental mode: check new images against the already sorted library
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            control_frame,
+            text="Incremental",
+            variable=self.incremental_var,
+            bootstyle="primary-round-toggle"
+        ).pack(side=LEFT, padx=5)
+        
+        # Also process images in subfolders (read when a folder is selected)
+        self.recursive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            control_frame,
+            text="Subfolders",
+            variable=self.recursive_var,
+            bootstyle="primary-round-toggle"
+        ).pack(side=LEFT, padx=5)
+        
+        # Make gallery thumbnails while scanning, so the categories open without decoding
+        self.thumbnails_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            control_frame,
+            text="Thumbnails",
+            variable=self.thumbnails_var,
+            bootstyle="primary-round-toggle"
+        ).pack(side=LEFT, padx=5)
+        
         # Merge & Split Files button (combined functionality)
         self.merge_split_btn = ttk.Button(
             control_frame,
@@ -181,6 +332,10 @@ class AdobeStockChecker:
         self.timer_label = ttk.Label(control_frame, text="Time: 00:00:00")
         self.timer_label.pack(side=LEFT, padx=20)
         
+        # Live throughput, ETA and the stage taking the most time
+        self.rate_label = ttk.Label(control_frame, text="")
+        self.rate_label.pack(side=LEFT, padx=20)
+        
         # Progress bar
         self.progress_bar = ttk.Progressbar(
             self.main_frame,
@@ -287,23 +442,19 @@ class AdobeStockChecker:
         gallery_content_frame = ttk.Frame(self.gallery_frame)
         gallery_content_frame.pack(fill=BOTH, expand=YES, pady=5)
         
-        # Canvas with scrollbar for thumbnails
+        # Canvas with scrollbar for thumbnails; only the rows in view get widgets
         self.gallery_canvas = tk.Canvas(gallery_content_frame, bg="#1a1a2e", highlightthickness=0)
         gallery_scrollbar = ttk.Scrollbar(gallery_content_frame, orient=VERTICAL, command=self.gallery_canvas.yview)
-        self.gallery_scrollable = ttk.Frame(self.gallery_canvas)
-        
-        self.gallery_scrollable.bind(
-            "<Configure>",
-            lambda e: self.gallery_canvas.configure(scrollregion=self.gallery_canvas.bbox("all"))
+        self.gallery_grid = VirtualThumbnailGrid(
+            self.gallery_canvas, gallery_scrollbar, self._thumbnail_cache,
+            load=self._load_gallery_thumbnail,
+            describe=self._describe_gallery_image,
+            is_selected=self._is_gallery_selected,
+            on_toggle=self._on_gallery_checkbox_toggle,
+            on_click=lambda path, group: self._on_gallery_thumbnail_click(self.current_gallery_category, path, group),
+            on_idle=self._commit_thumbnail_store
         )
         
-        self.gallery_canvas_window = self.gallery_canvas.create_window((0, 0), window=self.gallery_scrollable, anchor="nw")
-        self.gallery_canvas.configure(yscrollcommand=gallery_scrollbar.set)
-        
-        # Mouse wheel binding
-        self.gallery_canvas.bind("<MouseWheel>", lambda e: self.gallery_canvas.yview_scroll(int(-1*(e.delta/120)), "units"))
-        self.gallery_canvas.bind("<Configure>", lambda e: self.gallery_canvas.itemconfig(self.gallery_canvas_window, width=e.width))
-        
         gallery_scrollbar.pack(side=RIGHT, fill=Y)
         self.gallery_canvas.pack(side=LEFT, fill=BOTH, expand=YES)
         
@@ -393,6 +544,7 @@ class AdobeStockChecker:
     def hide_category_gallery(self):
         """Hide gallery and show check panels"""
         self.gallery_frame.pack_forget()
+        self.gallery_grid.clear()
         
         # Get the category results frame for reference
         results_frame = self.category_frames['Good'].master
@@ -428,30 +580,46 @@ class AdobeStockChecker:
                 self.category_title_labels[cat_name].configure(foreground="#FFFFFF", font=("TkDefaultFont", 14, "bold"))
     
     def update_category_counts(self):
-        """Update the image count display for all categories"""
+        """Update the image count display for all categories from the in-memory counters"""
         if not self.selected_folder:
             return
         
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
+        with self.progress_lock:
+            counts = dict(self.category_counts)
+        for cat_name, count in counts.items():
+            if cat_name in self.category_count_labels:
+                self.category_count_labels[cat_name].config(text=f"{cat_name} ({count} ภาพ)")
+    
+    def adjust_category_counts(self, deltas):
+        """Add {category name: change} to the counters (any thread); shown by the next UI refresh"""
+        with self.progress_lock:
+            for cat_name, delta in deltas.items():
+                if cat_name in self.category_counts:
+                    self.category_counts[cat_name] = max(0, self.category_counts[cat_name] + delta)
+        self.request_ui_update('counts')
+    
+    def set_category_count(self, cat_name, count):
+        """Set a counter from a fresh listing of its folder (e.g. when the gallery loads it)"""
+        with self.progress_lock:
+            self.category_counts[cat_name] = count
+        self.request_ui_update('counts')
+    
+    def reconcile_category_counts(self):
+        """Recount the category folders on disk, e.g. after other programs changed them"""
+        if not self.selected_folder:
+            return
         
         for cat_name in self.categories.values():
             folder = os.path.join(self.selected_folder, cat_name)
-            if os.path.exists(folder):
-                count = len([f for f in os.listdir(folder) 
-                            if f.lower().endswith(image_extensions) and os.path.isfile(os.path.join(folder, f))])
-            else:
-                count = 0
-            
-            if cat_name in self.category_count_labels:
-                self.category_count_labels[cat_name].config(text=f"{cat_name} ({count} ภาพ)")
+            count = sum(1 for _ in scan_images(folder)) if os.path.isdir(folder) else 0
+            self.set_category_count(cat_name, count)
+        self.update_category_counts()
     
     def _refresh_category_previews(self):
         """Refresh preview images for all categories"""
         if not self.selected_folder:
             return
         
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
-        
         for cat_name in self.categories.values():
             folder = os.path.join(self.selected_folder, cat_name)
             
@@ -462,13 +630,13 @@ class AdobeStockChecker:
             
             # Load first image as preview if folder has images
             if os.path.exists(folder):
-                images = [f for f in os.listdir(folder) 
-                         if f.lower().endswith(image_extensions) and os.path.isfile(os.path.join(folder, f))]
+                # Only the first image is needed, so stop reading the folder there
+                first_entry = next(scan_images(folder), None)
                 
-                if images:
-                    first_img = os.path.join(folder, images[0])
+                if first_entry is not None:
+                    first_img = first_entry.path
                     try:
-                        img = imread_unicode(first_img)
+                        img = load_thumbnail(first_img, CATEGORY_THUMBNAIL_SIZE, self.analysis_cache)
                         if img is not None:
                             thumb = self.resize_image(img, 200, 150)
                             thumb_tk = ImageTk.PhotoImage(Image.fromarray(thumb))
@@ -480,30 +648,29 @@ class AdobeStockChecker:
     def load_category_thumbnails(self, category):
         """Load thumbnails with fast loading"""
         # Clear existing thumbnails
-        for widget in self.gallery_scrollable.winfo_children():
-            widget.destroy()
+        self.gallery_grid.clear()
+        self._gallery_file_stats = {}
         
         # Reset manager
         manager = self.category_managers[category]
         manager['selected'] = set()
         manager['checkboxes'] = {}
+        manager['items'] = []
         
         # Get images from folder
         folder = os.path.join(self.selected_folder, category)
         good_folder = os.path.join(self.selected_folder, "Good")
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
         images = []
         
         if os.path.exists(folder):
-            images = [os.path.join(folder, f) for f in os.listdir(folder) 
-                      if f.lower().endswith(image_extensions) and os.path.isfile(os.path.join(folder, f))]
+            images = [entry.path for entry in scan_images(folder)]
+        self.set_category_count(category, len(images))
         
         # For Duplicate: ALSO scan Good folder to find matching pairs
         if category == 'Duplicate':
             good_images = []
             if os.path.exists(good_folder):
-                good_images = [os.path.join(good_folder, f) for f in os.listdir(good_folder) 
-                              if f.lower().endswith(image_extensions) and os.path.isfile(os.path.join(good_folder, f))]
+                good_images = [entry.path for entry in scan_images(good_folder)]
             
             # Combine both folders for similarity matching
             all_images = images + good_images
@@ -590,271 +757,77 @@ class AdobeStockChecker:
             updated_groups.append(updated_group)
         
         groups = updated_groups
-        moved_count = len([p for p in moved_files.values() if p != moved_files.get(p, p)])
+        moved_count = sum(1 for old_path, new_path in moved_files.items() if new_path != old_path)
         
         # Update category counts AND preview images after moving
         if moved_count > 0:
+            self.adjust_category_counts({'Good': -moved_count, 'Duplicate': moved_count})
             self.update_category_counts()
             self._refresh_category_previews()
         
         total_images = sum(len(g) for g in groups)
         self.gallery_stats.config(text=f"พบ {total_images} ภาพใน {len(groups)} กลุ่ม (ย้าย {len(files_to_move)} ภาพ)")
         
-        # Store pending thumbnails for async loading
-        pending_thumbnails = []
-        
-        for group_idx, group in enumerate(groups, 1):
-            # Group header
-            header_frame = ttk.Frame(self.gallery_scrollable)
-            header_frame.pack(fill=X, padx=10, pady=(15, 5))
-            
-            ttk.Label(
-                header_frame, 
-                text=f"Group {group_idx}",
-                font=("TkDefaultFont", 12, "bold"),
-                foreground="#4dabf7"
-            ).pack(anchor=W)
-            
-            # Separator line
-            ttk.Separator(self.gallery_scrollable, orient=HORIZONTAL).pack(fill=X, padx=10, pady=2)
-            
-            # Images row for this group
-            row_frame = ttk.Frame(self.gallery_scrollable)
-            row_frame.pack(fill=X, padx=10, pady=5)
-            
+        # Auto-mark files whose name contains 'copy'
+        for group in groups:
             for img_path in group:
-                # Create thumbnail frame
-                thumb_frame = ttk.Frame(row_frame)
-                thumb_frame.pack(side=LEFT, padx=5, pady=3)
-                
-                # Checkbox
-                var = tk.BooleanVar(value=False)
-                manager['checkboxes'][img_path] = var
-                
-                cb = ttk.Checkbutton(
-                    thumb_frame,
-                    variable=var,
-                    command=lambda p=img_path: self._on_gallery_checkbox_toggle(p),
-                    bootstyle="primary-round-toggle"
-                )
-                cb.pack(anchor=NE)
-                
-                # Placeholder for fast initial display
-                thumb_label = ttk.Label(thumb_frame, text="⏳", width=12, anchor=CENTER, cursor="hand2")
-                thumb_label.pack()
-                
-                # Filename
-                filename = os.path.basename(img_path)
-                is_copy = 'copy' in filename.lower()
-                display_name = filename[:18] + "..." if len(filename) > 21 else filename
-                
-                name_label = ttk.Label(thumb_frame, text=display_name, font=("TkDefaultFont", 8))
-                if is_copy:
-                    name_label.config(foreground="#ff6b6b")  # Red for copies
-                name_label.pack()
-                
-                # File info
-                try:
-                    stat = os.stat(img_path)
-                    mtime = datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%d/%m/%Y")
-                    ttk.Label(thumb_frame, text=f"{mtime}, {self._format_size(stat.st_size)}", 
-                              font=("TkDefaultFont", 8), foreground="#888888").pack()
-                except:
-                    pass
-                
-                # Add to pending for async loading
-                pending_thumbnails.append((thumb_label, img_path, category, group))
-                
-                # Auto-mark if filename contains 'copy'
-                if is_copy:
-                    var.set(True)
+                if 'copy' in os.path.basename(img_path).lower():
                     manager['selected'].add(img_path)
         
-        # Update UI immediately with placeholders
-        self.root.update_idletasks()
-        
-        # Load thumbnails in background thread
-        if pending_thumbnails:
-            threading.Thread(
-                target=self._load_grouped_thumbnails,
-                args=(pending_thumbnails,),
-                daemon=True
-            ).start()
-    
-    def _load_grouped_thumbnails(self, pending_list):
-        """Load thumbnails for grouped display in background"""
-        from concurrent.futures import ThreadPoolExecutor
-        
-        def load_single(item):
-            thumb_label, img_path, category, group = item
-            try:
-                if img_path in self._thumbnail_cache:
-                    return (thumb_label, self._thumbnail_cache[img_path], img_path, category, group)
-                
-                img = imread_unicode(img_path)
-                if img is not None:
-                    thumb = self.resize_image(img, 100, 80)
-                    return (thumb_label, thumb, img_path, category, group)
-            except:
-                pass
-            return (thumb_label, None, img_path, category, group)
-        
-        # Load in parallel
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            results = list(executor.map(load_single, pending_list))
-        
-        # Update UI from main thread
-        for thumb_label, thumb_data, img_path, category, group in results:
-            try:
-                if thumb_data is None:
-                    self.root.after(0, lambda l=thumb_label: l.config(text="❌") if l.winfo_exists() else None)
-                    continue
-                
-                if isinstance(thumb_data, ImageTk.PhotoImage):
-                    thumb_tk = thumb_data
-                else:
-                    thumb_tk = ImageTk.PhotoImage(Image.fromarray(thumb_data))
-                    self._thumbnail_cache[img_path] = thumb_tk
-                
-                def update_ui(label, image, path, cat, grp):
-                    if label.winfo_exists():
-                        label.config(image=image, text="")
-                        label.image_tk = image
-                        label.bind("<Button-1>", lambda e, p=path, g=grp: self._on_gallery_thumbnail_click(cat, p, g))
-                
-                self.root.after(0, lambda l=thumb_label, i=thumb_tk, p=img_path, c=category, g=group: update_ui(l, i, p, c, g))
-            except:
-                pass
+        manager['items'] = [img_path for group in groups for img_path in group]
+        self.gallery_grid.show(
+            [(f"Group {group_idx}", group) for group_idx, group in enumerate(groups, 1)],
+            GROUP_THUMBNAIL_SIZE
+        )
     
     def _create_thumbnail_grid(self, category, images):
-        """Create thumbnail grid with lazy loading for fast display"""
+        """Show a flat thumbnail grid; widgets are only built for the rows in view"""
         manager = self.category_managers[category]
-        
-        # Create rows
-        row_frame = None
-        col = 0
-        max_cols = 10
-        
-        # Store pending thumbnails for batch loading
-        pending_thumbnails = []
-        
-        for img_path in images:
-            # Create new row if needed
-            if col == 0 or col >= max_cols:
-                row_frame = ttk.Frame(self.gallery_scrollable)
-                row_frame.pack(fill=X, padx=5, pady=2)
-                col = 0
-            
-            # Create thumbnail frame
-            thumb_frame = ttk.Frame(row_frame)
-            thumb_frame.pack(side=LEFT, padx=3, pady=3)
-            
-            # Checkbox
-            var = tk.BooleanVar(value=False)
-            manager['checkboxes'][img_path] = var
-            
-            cb = ttk.Checkbutton(
-                thumb_frame,
-                variable=var,
-                command=lambda p=img_path: self._on_gallery_checkbox_toggle(p),
-                bootstyle="primary-round-toggle"
-            )
-            cb.pack(anchor=NE)
-            
-            # Create placeholder label first (instant display)
-            thumb_label = ttk.Label(thumb_frame, text="⏳", width=12, anchor=CENTER, cursor="hand2")
-            thumb_label.pack()
-            
-            # Filename (show immediately)
-            filename = os.path.basename(img_path)
-            is_copy = 'copy' in filename.lower()
-            display_name = filename[:12] + "..." if len(filename) > 15 else filename
-            
-            name_label = ttk.Label(thumb_frame, text=display_name, font=("TkDefaultFont", 8))
-            if is_copy:
-                name_label.config(foreground="#ff6b6b")
-            name_label.pack()
-            
-            # File size (show immediately - fast operation)
-            try:
-                size = os.path.getsize(img_path)
-                ttk.Label(thumb_frame, text=self._format_size(size), font=("TkDefaultFont", 8)).pack()
-            except:
-                pass
-            
-            # Add to pending list for background loading
-            pending_thumbnails.append((thumb_label, img_path, category))
-            
-            col += 1
-        
-        # Update UI immediately, then load images in background
-        self.root.update_idletasks()
-        
-        # Start background thread to load thumbnails
-        if pending_thumbnails:
-            threading.Thread(
-                target=self._load_thumbnails_batch,
-                args=(pending_thumbnails,),
-                daemon=True
-            ).start()
+        manager['items'] = list(images)
+        self.gallery_grid.show([(None, images)], GALLERY_THUMBNAIL_SIZE)
     
-    def _load_thumbnails_batch(self, pending_list):
-        """Load thumbnails in background using multiple threads for speed"""
-        from concurrent.futures import ThreadPoolExecutor
-        
-        def load_single_thumbnail(item):
-            thumb_label, img_path, category = item
-            try:
-                # Check cache first (fast path)
-                cache_key = img_path
-                if cache_key in self._thumbnail_cache:
-                    return (thumb_label, self._thumbnail_cache[cache_key], img_path, category, True)
-                
-                # Load and resize image
-                img = imread_unicode(img_path)
-                if img is None:
-                    return (thumb_label, None, img_path, category, False)
-                
-                thumb = self.resize_image(img, 100, 75)
-                return (thumb_label, thumb, img_path, category, True)
-                
-            except Exception as e:
-                return (thumb_label, None, img_path, category, False)
-        
-        def update_ui(result):
-            thumb_label, thumb_data, img_path, category, success = result
+    def _load_gallery_thumbnail(self, img_path, size):
+        """Thumbnail for a gallery cell as RGB (runs in the grid's loader threads)"""
+        img = load_thumbnail(img_path, size, self.analysis_cache)
+        if img is None:
+            return None
+        return self.resize_image(img, size[0], size[1])
+    
+    def _commit_thumbnail_store(self):
+        """Write the thumbnails made by the gallery to the analysis cache"""
+        if self.analysis_cache:
+            self.analysis_cache.commit()
+    
+    def _gallery_file_stat(self, img_path):
+        """os.stat of a gallery file, remembered for the current gallery (None if missing)"""
+        stats = self._gallery_file_stats
+        if img_path not in stats:
             try:
-                if not thumb_label.winfo_exists():
-                    return
-                
-                if not success or thumb_data is None:
-                    thumb_label.config(text="❌")
-                    return
-                
-                # Check if already PhotoImage (from cache) or numpy array
-                if isinstance(thumb_data, ImageTk.PhotoImage):
-                    thumb_tk = thumb_data
-                else:
-                    thumb_tk = ImageTk.PhotoImage(Image.fromarray(thumb_data))
-                    self._thumbnail_cache[img_path] = thumb_tk
-                
-                thumb_label.config(image=thumb_tk, text="")
-                thumb_label.image_tk = thumb_tk
-                
-                # Bind click event
-                manager = self.category_managers[category]
-                all_images = list(manager['checkboxes'].keys())
-                thumb_label.bind("<Button-1>", lambda e, p=img_path, g=all_images: self._on_gallery_thumbnail_click(category, p, g))
-            except:
-                pass
-        
-        # Use ThreadPoolExecutor for concurrent loading (8 workers for speed)
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            results = executor.map(load_single_thumbnail, pending_list)
-            
-            # Update UI as results come in
-            for result in results:
-                self.root.after(0, lambda r=result: update_ui(r))
+                stats[img_path] = os.stat(img_path)
+            except OSError:
+                stats[img_path] = None
+        return stats[img_path]
+    
+    def _describe_gallery_image(self, img_path):
+        """Name and info text of a gallery cell: (name, info, is_copy)"""
+        filename = os.path.basename(img_path)
+        is_copy = 'copy' in filename.lower()
+        stat = self._gallery_file_stat(img_path)
+        
+        if self.current_gallery_category == 'Duplicate':
+            display_name = filename[:18] + "..." if len(filename) > 21 else filename
+            info = ""
+            if stat is not None:
+                mtime = datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%d/%m/%Y")
+                info = f"{mtime}, {self._format_size(stat.st_size)}"
+        else:
+            display_name = filename[:12] + "..." if len(filename) > 15 else filename
+            info = self._format_size(stat.st_size) if stat is not None else ""
+        return display_name, info, is_copy
+    
+    def _is_gallery_selected(self, img_path):
+        category = self.current_gallery_category
+        return bool(category) and img_path in self.category_managers[category]['selected']
     
     def _on_gallery_thumbnail_click(self, category, img_path, group):
         """Handle thumbnail click in gallery - open fullscreen viewer"""
@@ -863,19 +836,17 @@ class AdobeStockChecker:
         manager['preview_index'] = group.index(img_path) if img_path in group else 0
         self._open_fullscreen_viewer(category)
     
-    def _on_gallery_checkbox_toggle(self, img_path):
+    def _on_gallery_checkbox_toggle(self, img_path, checked):
         """Handle checkbox toggle in gallery"""
         category = self.current_gallery_category
         if not category:
             return
         
         manager = self.category_managers[category]
-        var = manager['checkboxes'].get(img_path)
-        if var:
-            if var.get():
-                manager['selected'].add(img_path)
-            else:
-                manager['selected'].discard(img_path)
+        if checked:
+            manager['selected'].add(img_path)
+        else:
+            manager['selected'].discard(img_path)
         
         self._update_gallery_remove_button()
         self._update_auto_mark_button()
@@ -888,7 +859,8 @@ class AdobeStockChecker:
         
         manager = self.category_managers[category]
         count = len(manager['selected'])
-        total_size = sum(os.path.getsize(f) for f in manager['selected'] if os.path.exists(f))
+        stats = (self._gallery_file_stat(f) for f in manager['selected'])
+        total_size = sum(stat.st_size for stat in stats if stat is not None)
         self.gallery_remove_btn.config(
             text=f"🗑 Remove Selected ({count}) - {self._format_size(total_size)}"
         )
@@ -900,10 +872,10 @@ class AdobeStockChecker:
             return
         
         manager = self.category_managers[category]
-        total_checkboxes = len(manager['checkboxes'])
+        total_images = len(manager['items'])
         selected_count = len(manager['selected'])
         
-        if selected_count > 0 and selected_count == total_checkboxes:
+        if selected_count > 0 and selected_count == total_images:
             self.auto_mark_btn.config(text="✗ Unmark All", bootstyle="secondary")
         else:
             self.auto_mark_btn.config(text="✓ Auto Mark", bootstyle="primary")
@@ -915,10 +887,10 @@ class AdobeStockChecker:
             return
         
         manager = self.category_managers[category]
-        total_checkboxes = len(manager['checkboxes'])
+        total_images = len(manager['items'])
         selected_count = len(manager['selected'])
         
-        if selected_count > 0 and selected_count == total_checkboxes:
+        if selected_count > 0 and selected_count == total_images:
             # All selected - unmark all
             self.unmark_all_category(category)
         else:
@@ -978,11 +950,11 @@ class AdobeStockChecker:
                     os.remove(path)
                     deleted += 1
                     # Clear from cache
-                    if path in self._thumbnail_cache:
-                        del self._thumbnail_cache[path]
+                    self._thumbnail_cache.discard_path(path)
                 except Exception as e:
                     print(f"Error deleting {path}: {e}")
             
+            self.adjust_category_counts({category: -deleted})
             messagebox.showinfo("เสร็จสิ้น", f"ลบไฟล์แล้ว {deleted} ไฟล์")
             self.load_category_thumbnails(category)
     
@@ -992,8 +964,8 @@ class AdobeStockChecker:
             messagebox.showinfo("ไม่พบโฟลเดอร์", "กรุณาเลือกโฟลเดอร์ก่อน")
             return
         
-        # Check if processing is ongoing
-        if self.processing:
+        # Check if processing is ongoing (or a stopped run is still moving files)
+        if self._is_dispatching():
             messagebox.showwarning("กำลังประมวลผล", "กรุณารอให้การประมวลผลเสร็จสิ้นก่อน")
             return
         
@@ -1014,10 +986,10 @@ class AdobeStockChecker:
         for cat in category_folders:
             cat_folder = os.path.join(self.selected_folder, cat)
             if os.path.exists(cat_folder):
-                for f in os.listdir(cat_folder):
-                    filepath = os.path.join(cat_folder, f)
-                    if os.path.isfile(filepath):
-                        files_to_move.append((filepath, f, cat))
+                with os.scandir(cat_folder) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            files_to_move.append((entry.path, entry.name, cat))
         
         if not files_to_move:
             messagebox.showinfo("ไม่มีไฟล์", "ไม่พบไฟล์ในโฟลเดอร์ย่อย")
@@ -1025,16 +997,8 @@ class AdobeStockChecker:
         
         # Move files silently
         for filepath, filename, category in files_to_move:
-            dest_path = os.path.join(self.selected_folder, filename)
-            
             # Handle name conflicts
-            if os.path.exists(dest_path):
-                name, ext = os.path.splitext(filename)
-                counter = 1
-                while os.path.exists(dest_path):
-                    new_name = f"{name}_{counter}{ext}"
-                    dest_path = os.path.join(self.selected_folder, new_name)
-                    counter += 1
+            dest_path = unique_path(self.selected_folder, filename)
             
             try:
                 shutil.move(filepath, dest_path)
@@ -1062,9 +1026,7 @@ class AdobeStockChecker:
     def _quick_split_dialog(self, source_folder):
         """Quick dialog to ask files per folder and split immediately"""
         # Count total files
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.gif', '.webp')
-        files = [f for f in os.listdir(source_folder) 
-                 if f.lower().endswith(image_extensions) and os.path.isfile(os.path.join(source_folder, f))]
+        files = [entry.name for entry in scan_images(source_folder, extensions=IMAGE_EXTENSIONS + ('.gif',))]
         
         if not files:
             messagebox.showinfo("ไม่มีไฟล์", "ไม่พบไฟล์ภาพในโฟลเดอร์")
@@ -1165,6 +1127,10 @@ class AdobeStockChecker:
     
     def clear_all_data(self):
         """Clear all data and reset UI to initial state"""
+        if self._is_dispatching():
+            messagebox.showwarning("กำลังประมวลผล", "กรุณาหยุดและรอให้การประมวลผลเสร็จสิ้นก่อน")
+            return
+        
         # Hide gallery if shown
         if self.current_gallery_category:
             self.hide_category_gallery()
@@ -1174,31 +1140,23 @@ class AdobeStockChecker:
         self.select_btn.config(text="📂 Select Images Folder")
         
         # Clear hash data
-        self.image_hashes = {}
-        self._thumbnail_cache = {}
-        if hasattr(self, '_hash_cache'):
-            self._hash_cache = {}
+        self.hash_index.clear()
+        self._library_seeded = False
+        self._thumbnail_cache.clear()
+        self.close_analysis_cache()
         
-        # Clear queues
-        while not self.left_queue.empty():
-            try:
-                self.left_queue.get_nowait()
-            except:
-                break
-        while not self.right_queue.empty():
-            try:
-                self.right_queue.get_nowait()
-            except:
-                break
+        # Stop a running folder scan, then clear queues
+        self._reset_scan()
         
         # Reset category managers
         for cat in self.category_managers:
             self.category_managers[cat] = {
-                'groups': {}, 'selected': set(), 'checkboxes': {}, 
+                'groups': {}, 'selected': set(), 'checkboxes': {}, 'items': [],
                 'current_group': [], 'preview_index': 0
             }
         
         # Clear category previews and counts
+        self.category_counts = {name: 0 for name in self.categories.values()}
         for cat_name in self.categories.values():
             if cat_name in self.category_labels:
                 self.category_labels[cat_name].config(image='')
@@ -1206,8 +1164,6 @@ class AdobeStockChecker:
                 self.category_count_labels[cat_name].config(text="(0 ภาพ)")
         
         # Reset processing state
-        self.total_images = 0
-        self.processed_images = 0
         self.processing = False
         self.start_time = None
         
@@ -1224,9 +1180,15 @@ class AdobeStockChecker:
         self.progress_bar["value"] = 0
         self.progress_bar["maximum"] = 0
         self.timer_label.config(text="Time: 00:00:00")
+        self.rate_label.config(text="")
+        self.stage_timer = StageTimer()
+        self.run_categories = {}
         self.start_btn.config(text="▶ Start Processing", bootstyle="success")
         
-        # Clear image displays
+        # Clear image displays (and drop previews not drawn yet)
+        with self._ui_lock:
+            self._pending_previews.clear()
+            self._pending_thumbnails.clear()
         self.left_img_label.config(image='')
         self.right_img_label.config(image='')
         
@@ -1274,23 +1236,14 @@ class AdobeStockChecker:
         manager['checkboxes'] = {}
         
         # Find images in category folder and Good folder
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
         all_images = []
         
         if os.path.exists(category_folder):
-            for f in os.listdir(category_folder):
-                if f.lower().endswith(image_extensions):
-                    filepath = os.path.join(category_folder, f)
-                    if os.path.isfile(filepath):
-                        all_images.append(filepath)
+            all_images.extend(entry.path for entry in scan_images(category_folder))
         
         # For Duplicate, also scan Good folder
         if category == 'Duplicate' and os.path.exists(good_folder):
-            for f in os.listdir(good_folder):
-                if f.lower().endswith(image_extensions):
-                    filepath = os.path.join(good_folder, f)
-                    if os.path.isfile(filepath):
-                        all_images.append(filepath)
+            all_images.extend(entry.path for entry in scan_images(good_folder))
         
         if not all_images:
             self.cat_ui[category]['stats_label'].config(text=f"ไม่พบภาพในโฟลเดอร์ {category}")
@@ -1352,79 +1305,57 @@ class AdobeStockChecker:
         if not images:
             return []
         
-        # Initialize hash cache if not exists
-        if not hasattr(self, '_hash_cache'):
-            self._hash_cache = {}
-        
-        # Calculate hashes - use cache when available
+        # Hashes come from the folder's analysis cache; only unknown files are decoded
+        cache = self.analysis_cache
         image_hashes = {}
         images_to_hash = []
         
         for img_path in images:
-            # Check cache first (use file path + modification time as key)
-            try:
-                mtime = os.path.getmtime(img_path)
-                cache_key = (img_path, mtime)
-                
-                if cache_key in self._hash_cache:
-                    image_hashes[img_path] = self._hash_cache[cache_key]
-                else:
-                    images_to_hash.append((img_path, cache_key))
-            except:
-                images_to_hash.append((img_path, None))
+            analysis = cache.lookup_path(img_path) if cache else None
+            if analysis is not None:
+                image_hashes[img_path] = analysis['phash']
+            else:
+                images_to_hash.append(img_path)
         
         # Parallel hash calculation for uncached images
         if images_to_hash:
             from concurrent.futures import ThreadPoolExecutor
             
-            def compute_hash(item):
-                img_path, cache_key = item
+            def compute_hash(img_path):
                 try:
-                    img, _ = prepare_image(img_path)
-                    if img is not None:
-                        pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-                        if pil_img.mode != 'RGB':
-                            pil_img = pil_img.convert('RGB')
-                        hash_val = imagehash.phash(pil_img, hash_size=HASH_SIZE)
-                        return img_path, hash_val, cache_key
+                    # Same content-key lookup (through this window's own cache connection),
+                    # reduced analysis decode and hash as the scan
+                    key = None
+                    if cache:
+                        key = content_key(img_path)
+                        analysis = cache.lookup_key(key)
+                        if analysis is not None:
+                            return img_path, result_from_analysis(img_path, 0, analysis)
+                    result = check_image_standalone(img_path, 0)
+                    if not result.get('error'):
+                        result['content_key'] = key
+                        return img_path, result
                 except Exception as e:
                     print(f"Error hashing {img_path}: {e}")
-                return img_path, None, cache_key
+                return img_path, None
             
             # Use thread pool for I/O-bound operations
             with ThreadPoolExecutor(max_workers=8) as executor:
                 results = list(executor.map(compute_hash, images_to_hash))
             
-            for img_path, hash_val, cache_key in results:
-                if hash_val is not None:
-                    image_hashes[img_path] = hash_val
-                    # Cache the result
-                    if cache_key:
-                        self._hash_cache[cache_key] = hash_val
-        
-        # Group by similarity
-        used = set()
-        groups = []
-        
-        for path1, hash1 in image_hashes.items():
-            if path1 in used:
-                continue
-            
-            group = [path1]
-            used.add(path1)
-            
-            for path2, hash2 in image_hashes.items():
-                if path2 in used:
-                    continue
-                
-                distance = hash1 - hash2
-                if distance <= SIMILARITY_THRESHOLD:
-                    group.append(path2)
-                    used.add(path2)
-            
-            groups.append(group)
-        
-        return groups
+            for img_path, result in results:
+                if result is not None and result.get('phash'):
+                    image_hashes[img_path] = result['phash']
+                    # Cache the result (also keys the path for the next stat lookup)
+                    if cache:
+                        cache.store(img_path, result)
+            if cache:
+                cache.commit()
+        
+        # Group by similarity (vectorized all-pairs Hamming distance + union-find)
+        paths = list(image_hashes.keys())
+        index_groups = group_hashes_by_similarity(list(image_hashes.values()))
+        return [[paths[i] for i in group] for group in index_groups]
     
     def _create_category_group_ui(self, category, group_id, images):
         """Create UI for a group in category manager"""
@@ -1492,11 +1423,14 @@ class AdobeStockChecker:
         
         # Thumbnail image
         try:
-            img = imread_unicode(img_path)
-            if img is not None:
-                thumb = self.resize_image(img, 120, 90)
-                thumb_tk = ImageTk.PhotoImage(Image.fromarray(thumb))
-                
+            width, height = CATEGORY_GROUP_THUMBNAIL_SIZE
+            thumb_tk = self._thumbnail_cache.get((img_path, width, height))
+            if thumb_tk is None:
+                img = load_thumbnail(img_path, CATEGORY_GROUP_THUMBNAIL_SIZE, self.analysis_cache)
+                if img is not None:
+                    thumb_tk = ImageTk.PhotoImage(Image.fromarray(self.resize_image(img, width, height)))
+                    self._thumbnail_cache.put((img_path, width, height), thumb_tk)
+            if thumb_tk is not None:
                 thumb_label = ttk.Label(thumb_frame, image=thumb_tk, cursor="hand2")
                 thumb_label.image_tk = thumb_tk
                 thumb_label.pack()
@@ -1811,22 +1745,13 @@ class AdobeStockChecker:
         category_folder = os.path.join(self.selected_folder, category)
         good_folder = os.path.join(self.selected_folder, "Good")
         
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
         all_images = []
         
         if os.path.exists(category_folder):
-            for f in os.listdir(category_folder):
-                if f.lower().endswith(image_extensions):
-                    filepath = os.path.join(category_folder, f)
-                    if os.path.isfile(filepath):
-                        all_images.append(filepath)
+            all_images.extend(entry.path for entry in scan_images(category_folder))
         
         if category == 'Duplicate' and os.path.exists(good_folder):
-            for f in os.listdir(good_folder):
-                if f.lower().endswith(image_extensions):
-                    filepath = os.path.join(good_folder, f)
-                    if os.path.isfile(filepath):
-                        all_images.append(filepath)
+            all_images.extend(entry.path for entry in scan_images(good_folder))
         
         if category == 'Duplicate':
             # For Duplicate: mark only files with 'copy' in filename (case insensitive)
@@ -1846,6 +1771,8 @@ class AdobeStockChecker:
                     if path in manager['checkboxes']:
                         manager['checkboxes'][path].set(True)
         
+        if self.current_gallery_category == category:
+            self.gallery_grid.refresh_checks()
         self._update_gallery_remove_button()
         self._update_auto_mark_button()
     
@@ -1855,6 +1782,8 @@ class AdobeStockChecker:
         manager['selected'].clear()
         for var in manager['checkboxes'].values():
             var.set(False)
+        if self.current_gallery_category == category:
+            self.gallery_grid.refresh_checks()
         self._update_category_remove_button(category)
     
     def remove_selected_category(self, category):
@@ -1871,9 +1800,11 @@ class AdobeStockChecker:
                 try:
                     os.remove(path)
                     deleted += 1
+                    self._thumbnail_cache.discard_path(path)
                 except Exception as e:
                     print(f"Error deleting {path}: {e}")
             
+            self.adjust_category_counts({category: -deleted})
             messagebox.showinfo("เสร็จสิ้น", f"ลบไฟล์แล้ว {deleted} ไฟล์")
             self.refresh_category_groups(category)
     
@@ -1900,10 +1831,7 @@ class AdobeStockChecker:
             return
         
         # Count image files
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
-        image_files = [f for f in os.listdir(source_folder) 
-                       if f.lower().endswith(image_extensions) 
-                       and os.path.isfile(os.path.join(source_folder, f))]
+        image_files = [entry.name for entry in scan_images(source_folder)]
         
         total_files = len(image_files)
         if total_files == 0:
@@ -2028,150 +1956,22 @@ class AdobeStockChecker:
         y = self.root.winfo_y() + (self.root.winfo_height() - dialog.winfo_height()) // 2
         dialog.geometry(f"+{x}+{y}")
     
-    # ==================== METADATA REMOVAL ====================
-    
-    def remove_metadata_from_file(self, filepath):
-        """
-        Remove metadata from image file (in-place).
-        Based on MetaSweep Pro's approach.
-        """
-        filepath_lower = filepath.lower()
-        
-        try:
-            if filepath_lower.endswith(('.jpg', '.jpeg')):
-                self._remove_jpeg_metadata(filepath)
-            elif filepath_lower.endswith('.png'):
-                self._remove_png_metadata(filepath)
-            # Other formats (tif, bmp) are left as-is for now
-        except Exception as e:
-            print(f"Error removing metadata from {filepath}: {e}")
-    
-    def _remove_jpeg_metadata(self, filepath):
-        """
-        Remove all metadata markers from JPEG for complete clean sweep.
-        
-        Markers removed:
-        - 0xE1 (APP1): EXIF, XMP
-        - 0xE2 (APP2): ICC Profile  
-        - 0xEB (APP11): JUMBF, C2PA, Google Generative AI
-        - 0xEC (APP12): Picture Info
-        - 0xED (APP13): IPTC, Photoshop Resources
-        - 0xEE (APP14): Adobe
-        - 0xFE (COM): JPEG Comments
-        """
-        with open(filepath, 'rb') as f:
-            data = f.read()
-            
-        # Verify JPEG
-        if data[:2] != b'\xff\xd8':
-            return  # Not a valid JPEG
-            
-        # Build new file without metadata segments
-        new_data = bytearray()
-        new_data.extend(data[:2])  # SOI marker
-        
-        # Markers to REMOVE for complete clean sweep
-        markers_to_remove = {
-            0xE1,  # APP1 - EXIF/XMP
-            0xE2,  # APP2 - ICC Profile
-            0xEB,  # APP11 - JUMBF/C2PA/Google AI
-            0xEC,  # APP12 - Picture Info
-            0xED,  # APP13 - IPTC/Photoshop
-            0xEE,  # APP14 - Adobe
-            0xFE,  # COM - Comments
-        }
-        
-        i = 2
-        while i < len(data) - 1:
-            if data[i] != 0xff:
-                new_data.extend(data[i:])
-                break
-                
-            marker = data[i + 1]
-            
-            # SOS - Start of Scan (image data begins)
-            if marker == 0xda:
-                new_data.extend(data[i:])
-                break
-                
-            # EOI - End of Image
-            if marker == 0xd9:
-                new_data.extend(data[i:i+2])
-                break
-                
-            # Markers without length (RST0-RST7, SOI, EOI, TEM)
-            if marker in (0xd0, 0xd1, 0xd2, 0xd3, 0xd4, 0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0x01):
-                new_data.extend(data[i:i+2])
-                i += 2
-                continue
-                
-            # Get segment length
-            if i + 3 >= len(data):
-                break
-            length = (data[i + 2] << 8) + data[i + 3]
-            
-            # Check if marker should be removed
-            if marker in markers_to_remove:
-                # Skip this segment (don't copy)
-                i += 2 + length
-            else:
-                # Keep this segment
-                new_data.extend(data[i:i + 2 + length])
-                i += 2 + length
-                
-        # Write back to file
-        with open(filepath, 'wb') as f:
-            f.write(new_data)
-    
-    def _remove_png_metadata(self, filepath):
-        """Remove metadata chunks from PNG, keep only essential chunks."""
-        with open(filepath, 'rb') as f:
-            data = f.read()
-            
-        png_signature = b'\x89PNG\r\n\x1a\n'
-        if data[:8] != png_signature:
-            return  # Not a valid PNG
-            
-        # Chunks to keep (essential for image display)
-        keep_chunks = {b'IHDR', b'PLTE', b'IDAT', b'IEND', b'tRNS', b'cHRM',
-                       b'gAMA', b'sBIT', b'bKGD', b'hIST', b'pHYs', b'sPLT'}
-                       
-        new_data = bytearray()
-        new_data.extend(png_signature)
-        
-        i = 8
-        while i < len(data):
-            if i + 8 > len(data):
-                break
-                
-            length = int.from_bytes(data[i:i+4], 'big')
-            chunk_type = data[i+4:i+8]
-            chunk_size = 12 + length
-            
-            if i + chunk_size > len(data):
-                break
-                
-            # Keep only essential chunks
-            if chunk_type in keep_chunks:
-                new_data.extend(data[i:i + chunk_size])
-                
-            i += chunk_size
-            
-        with open(filepath, 'wb') as f:
-            f.write(new_data)
-    
     def select_folder(self):
         """Select folder containing images"""
+        # The dispatcher keeps using the folder's analysis cache until it has drained
+        if self._is_dispatching():
+            messagebox.showwarning("กำลังประมวลผล", "กรุณาหยุดและรอให้การประมวลผลเสร็จสิ้นก่อน")
+            return
+        
         folder = filedialog.askdirectory(title="Select folder with images")
         if not folder:
             return  # User cancelled
         
         # Clear previous data first (but keep selected_folder for now)
         old_folder = self.selected_folder
-        self._thumbnail_cache = {}
-        if hasattr(self, '_hash_cache'):
-            self._hash_cache = {}
-        self.image_hashes = {}
+        self._thumbnail_cache.clear()
+        self.hash_index.clear()
+        self._library_seeded = False
         
         # Hide gallery if shown
         if self.current_gallery_category:
@@ -2180,7 +1980,7 @@ class AdobeStockChecker:
         # Reset category managers
         for cat in self.category_managers:
             self.category_managers[cat] = {
-                'groups': {}, 'selected': set(), 'checkboxes': {}, 
+                'groups': {}, 'selected': set(), 'checkboxes': {}, 'items': [],
                 'current_group': [], 'preview_index': 0
             }
         
@@ -2189,7 +1989,10 @@ class AdobeStockChecker:
             if cat_name in self.category_labels:
                 self.category_labels[cat_name].config(image='')
         
-        # Clear image displays
+        # Clear image displays (and drop previews not drawn yet)
+        with self._ui_lock:
+            self._pending_previews.clear()
+            self._pending_thumbnails.clear()
         self.left_img_label.config(image='')
         self.right_img_label.config(image='')
         
@@ -2204,50 +2007,104 @@ class AdobeStockChecker:
             category_folder = os.path.join(folder, category)
             os.makedirs(category_folder, exist_ok=True)
         
-        # Update category counts
-        self.update_category_counts()
-        
-        # Get all image files
-        image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
-        image_files = [
-            os.path.join(folder, f) for f in os.listdir(folder)
-            if f.lower().endswith(image_extensions) and os.path.isfile(os.path.join(folder, f))
-        ]
-        
-        # If no images found, just update UI without error popup
-        if not image_files:
-            self.progress_label.config(text="No images found in this folder")
-            self.progress_bar["value"] = 0
-            self.progress_bar["maximum"] = 0
-            return
-        
-        # Clear existing queues
-        while not self.left_queue.empty():
-            self.left_queue.get()
-        while not self.right_queue.empty():
-            self.right_queue.get()
+        # Open the folder's analysis cache (results survive moving and stripping)
+        self.open_analysis_cache(folder)
         
-        # Reset processing state
-        self.total_images = len(image_files)
-        self.processed_images = 0
-        
-        # Split images between queues (50% each)
-        middle_index = math.ceil(self.total_images / 2)
-        
-        # First half to left queue
-        for i in range(0, middle_index):
-            self.left_queue.put(image_files[i])
+        # Count what is already sorted; from here on the counters follow the results
+        self.reconcile_category_counts()
         
-        # Second half to right queue
-        for i in range(middle_index, self.total_images):
-            self.right_queue.put(image_files[i])
+        # Stop the previous folder's scan and clear the queue and counters
+        generation = self._reset_scan()
         
         # Update UI
-        self.progress_label.config(text=f"Ready to process {self.total_images} images")
+        self.progress_label.config(text="Scanning folder...")
         self.progress_bar["value"] = 0
-        self.progress_bar["maximum"] = self.total_images
+        self.progress_bar["maximum"] = 0
         self.start_btn.config(state=NORMAL)
         self.timer_label.config(text="Time: 00:00:00")
+        self.rate_label.config(text="")
+        self.stage_timer = StageTimer()
+        self.run_categories = {}
+        
+        # Images stream into the shared queue while the folder is still being read,
+        # so processing can start right away on large folders and network shares
+        self.scan_done = threading.Event()
+        threading.Thread(
+            target=self._enumerate_folder,
+            args=(folder, self.recursive_var.get(), generation, self.scan_done),
+            daemon=True
+        ).start()
+    
+    def _reset_scan(self):
+        """
+        Invalidate any running folder scan, then empty the work queue and the counters.
+        Done under progress_lock, which the scan also holds while queueing, so no
+        path of the old folder can slip into the new run.
+        Returns: the new scan generation
+        """
+        with self.progress_lock:
+            self._scan_generation += 1
+            while not self.work_queue.empty():
+                try:
+                    self.work_queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.total_images = 0
+            self.processed_images = 0
+            return self._scan_generation
+    
+    def _enumerate_folder(self, folder, recursive, generation, done):
+        """Feed the folder's images into the work queue as they are found (background thread)"""
+        try:
+            for entry in scan_images(folder, recursive, skip_dirs=self.categories.values()):
+                with self.progress_lock:
+                    if generation != self._scan_generation:
+                        return  # Another folder was selected (or data cleared)
+                    self.work_queue.put(entry.path)
+                    self.total_images += 1
+                    found = self.total_images
+                if found % 1000 == 0:
+                    self.root.after(0, self._update_scan_progress)
+        finally:
+            done.set()
+        
+        if generation == self._scan_generation:
+            self.root.after(0, self._finish_scan)
+    
+    def _update_scan_progress(self):
+        """Show how many images the folder scan has found so far"""
+        self.progress_bar["maximum"] = self.total_images
+        if not self.processing:
+            self.progress_label.config(text=f"Scanning folder... found {self.total_images} images")
+    
+    def _finish_scan(self):
+        """Update the UI when the folder scan is complete"""
+        self.progress_bar["maximum"] = self.total_images
+        if self.processing:
+            self.update_progress()
+        elif not self.total_images:
+            # If no images found, just update UI without error popup
+            self.progress_label.config(text="No images found in this folder")
+        else:
+            self.progress_label.config(text=f"Ready to process {self.total_images} images")
+    
+    def open_analysis_cache(self, folder):
+        """Open the analysis cache of a folder, closing the previous one"""
+        self.close_analysis_cache()
+        try:
+            self.analysis_cache = AnalysisCache(cache_path_for(folder))
+        except Exception as e:
+            print(f"Error opening analysis cache: {e}")
+            self.analysis_cache = None
+    
+    def close_analysis_cache(self):
+        """Commit and close the analysis cache"""
+        if self.analysis_cache:
+            try:
+                self.analysis_cache.close()
+            except Exception as e:
+                print(f"Error closing analysis cache: {e}")
+            self.analysis_cache = None
     
     def toggle_processing(self):
         """Start or stop image processing"""
@@ -2257,8 +2114,8 @@ class AdobeStockChecker:
             self.start_btn.config(text="Start Processing", bootstyle="success")
             self.stop_timer()
         else:
-            # Check if we have images to process
-            if self.left_queue.empty() and self.right_queue.empty():
+            # Check if we have images to process (the folder scan may still be adding some)
+            if self.work_queue.empty() and self.scan_done.is_set():
                 messagebox.showinfo("No Images", "Please select a folder with images first.")
                 return
             
@@ -2269,13 +2126,21 @@ class AdobeStockChecker:
             # Start the timer
             self.start_timer()
             
-            # Launch processing threads
-            threading.Thread(target=self.process_left_images, daemon=True).start()
-            threading.Thread(target=self.process_right_images, daemon=True).start()
+            # Launch the dispatcher thread (a stopped one may still be draining; it resumes submitting)
+            with self._dispatch_lock:
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self.process_images, daemon=True)
+                    self._dispatcher.start()
+    
+    def _is_dispatching(self):
+        """True while a run is going or a stopped one is still finishing its moves"""
+        with self._dispatch_lock:
+            return self.processing or self._dispatcher is not None
     
     def start_timer(self):
         """Start the processing timer"""
         self.start_time = time.time()
+        self.rate_meter = RateMeter()
         self.update_timer()
     
     def stop_timer(self):
@@ -2292,108 +2157,225 @@ class AdobeStockChecker:
             
             time_str = f"Time: {hours:02d}:{minutes:02d}:{seconds:02d}"
             self.timer_label.config(text=time_str)
+            self.update_rate()
             
             # Schedule the next update
             self.root.after(1000, self.update_timer)
     
-    def process_left_images(self):
-        """Process images from the left queue"""
-        self.process_images(self.left_queue, 0)
-    
-    def process_right_images(self):
-        """Process images from the right queue"""
-        self.process_images(self.right_queue, 1)
+    def update_rate(self):
+        """Show images/s over the last seconds, the ETA and the stage taking the most time"""
+        processed = self.processed_images
+        rate = self.rate_meter.update(processed)
+        if rate is None:
+            return
+        
+        eta = self.rate_meter.eta(processed, self.total_images, rate)
+        text = f"{rate:.1f} images/s  ETA: {format_duration(eta) if eta is not None else '--:--:--'}"
+        busiest = self.stage_timer.busiest()
+        if busiest:
+            text += f"  (most time: {busiest})"
+        self.rate_label.config(text=text)
     
-    def process_images(self, image_queue, position):
-        """Process images from a queue using multi-core processing"""
+    def process_images(self):
+        """
+        Feed the shared work queue to every pool worker, keeping several tasks
+        in flight per worker. The left/right panes alternate over completed results.
+        """
         if not self.executor:
             self.executor = ProcessPoolExecutor(max_workers=self.num_cores)
-
-        while self.processing and not image_queue.empty():
-            try:
-                # Get next image
-                image_path = image_queue.get(block=False)
-                
-                # Copy hashes with lock to ensure thread-safety
-                # This prevents race condition where duplicate images are missed
-                with self.hash_lock:
-                    current_hashes = self.image_hashes.copy()
-                
-                # Check image using process pool
+        
+        window = max(1, self.num_cores * self.in_flight_per_worker)
+        submitted = [0]
+        cache = self.analysis_cache
+        scan_done = self.scan_done
+        thumbnail_sizes = SCAN_THUMBNAIL_SIZES if cache and self.thumbnails_var.get() else None
+        
+        # Incremental mode: load the hashes of the already sorted images first
+        if self.incremental_var.get() and not self._library_seeded and self.selected_folder:
+            self.root.after(0, lambda: self.progress_label.config(text="Loading library hashes..."))
+            count = seed_library(
+                self.selected_folder, self.categories.values(), self.hash_index, cache, self.executor, window
+            )
+            self._library_seeded = True
+            print(f"Loaded {count} library hashes")
+        
+        def submit(image_path):
+            # Workers only hash; the duplicate decision is made against the shared index
+            position = submitted[0] % 2
+            submitted[0] += 1
+            
+            # Unchanged files already analysed are answered from the cache without a worker
+            future = cached_future(cache, image_path, position)
+            if future is None:
                 future = self.executor.submit(
                     check_image_standalone, 
                     image_path, 
-                    position, 
-                    current_hashes
+                    position,
+                    PREVIEW_SIZE,
+                    cache.path if cache else None,
+                    thumbnail_sizes
                 )
-                
-                # Wait for result
-                result = future.result()
-                
-                if result.get('error'):
-                    image_queue.task_done()
-                    continue
-
-                # Update hash IMMEDIATELY after getting result (before anything else)
-                # This ensures the next image check will see this hash
-                if result.get('new_hashes'):
-                    with self.hash_lock:
-                        self.image_hashes.update(result['new_hashes'])
-
-                # Load image for display (this is done in main thread to avoid pickling issues)
-                img = imread_unicode(image_path)
-                if img is None:
-                    image_queue.task_done()
-                    continue
-                
-                # Display image
-                self.update_image_display(img, position)
-
-                # Put result in result queue
-                self.result_queue.put(result)
-                
-                # Update progress
+            return future, position
+        
+        def handle(image_path, result, position):
+            if result.get('error'):
+                return
+            timer = self.stage_timer
+            timer.add_all(result.get('timings'))
+            
+            # Check and store hash IMMEDIATELY after getting result (before anything else)
+            # This ensures the next image check will see this hash
+            started = time.perf_counter()
+            self.hash_index.commit(result)
+            if cache and result.get('cached') != 'path':
+                cache.store(image_path, result)
+                # Thumbnails made by the worker: the gallery will not decode this image again
+                for size, data in (result.pop('thumbnails', None) or {}).items():
+                    cache.store_thumbnail(result['content_key'], size, data)
+            timer.add('index', time.perf_counter() - started)
+            
+            # The worker's JPEG preview is only decoded if it is still the latest at the next UI refresh
+            # (results answered from the cache have none; the file is decoded only if it gets drawn)
+            self.update_image_display(result.get('preview') or image_path, position)
+            
+            # Hand the result to the file stage (blocks while its queue is full)
+            started = time.perf_counter()
+            self.file_stage.submit(result)
+            timer.add('move_queue_wait', time.perf_counter() - started)
+            
+            # Update progress (drawn by the next UI refresh)
+            category_name = self.categories[result['category']]
+            with self.progress_lock:
                 self.processed_images += 1
-                self.root.after(0, self.update_progress)
-                
-                # Mark task done
-                image_queue.task_done()
+                self.run_categories[category_name] = self.run_categories.get(category_name, 0) + 1
+            self.request_ui_update('progress')
+        
+        try:
+            while True:
+                run_pipelined(self.work_queue, submit, handle, window, lambda: self.processing, scan_done)
                 
-                # Reduced delay
-                time.sleep(0.01)
+                # Let the file stage finish moving what it was given
+                self.file_stage.join()
+                if cache:
+                    cache.commit()
                 
-            except queue.Empty:
+                with self._dispatch_lock:
+                    # Start may have been pressed again while the moves were finishing: carry on
+                    if self.processing and not (self.work_queue.empty() and scan_done.is_set()):
+                        continue
+                    self._dispatcher = None
+                    finished = self.processing
                 break
-            except Exception as e:
-                print(f"Error processing image: {e}")
-                image_queue.task_done()
-        
-        # If all queues empty, finalize
-        if (self.left_queue.empty() and self.right_queue.empty() and self.processing):
+        finally:
+            # Never leave Start waiting on a dispatcher that died
+            with self._dispatch_lock:
+                if self._dispatcher is threading.current_thread():
+                    self._dispatcher = None
+        
+        # All in-flight tasks are drained at this point
+        if finished:
             self.root.after(0, self.finalize_processing)
     
-    def update_image_display(self, img, position):
-        """Display image in the appropriate panel"""
-        if position == 0:
-            label = self.left_img_label
-            # ปรับขนาดให้เหมาะสมกับหน้าจอที่เล็กลง
-            width = 800
-            height = 450
-        else:
-            label = self.right_img_label
-            # ปรับขนาดให้เหมาะสมกับหน้าจอที่เล็กลง
-            width = 800
-            height = 450
-        
-        # Resize image to fit panel
-        display_img = self.resize_image(img, width, height)
+    def update_image_display(self, preview, position):
+        """Show JPEG preview bytes (or an image path) in the left (0) or right panel; only the latest per panel is decoded and drawn"""
+        with self._ui_lock:
+            self._pending_previews[position] = preview
+    
+    def request_ui_update(self, *parts):
+        """Mark 'progress' and/or 'counts' for redrawing by the next UI refresh (any thread)"""
+        with self._ui_lock:
+            self._ui_dirty.update(parts)
+    
+    def _refresh_ui(self):
+        """
+        Draw the pending progress, counts, previews and thumbnails on the Tk
+        thread, however many results arrived since the last refresh.
+        Images for panels that aren't visible (window minimized, gallery
+        shown) stay pending until they are.
+        """
+        with self._ui_lock:
+            previews, self._pending_previews = self._pending_previews, {}
+            thumbnails, self._pending_thumbnails = self._pending_thumbnails, {}
+            dirty, self._ui_dirty = self._ui_dirty, set()
         
-        # Convert to tkinter format
-        img_tk = ImageTk.PhotoImage(Image.fromarray(display_img))
+        try:
+            if 'progress' in dirty:
+                self.update_progress()
+            if 'counts' in dirty:
+                self.update_category_counts()
+            
+            hidden_previews = {}
+            for position, preview in previews.items():
+                # ปรับขนาดให้เหมาะสมกับหน้าจอที่เล็กลง
+                label = self.left_img_label if position == 0 else self.right_img_label
+                if label.winfo_ismapped():
+                    preview = self._draw_preview(('pane', position), label, preview, PREVIEW_SIZE, 'preview')
+                if preview is not None:
+                    hidden_previews[position] = preview
+            
+            hidden_thumbnails = {}
+            for category_name, preview in thumbnails.items():
+                label = self.category_labels.get(category_name)
+                if label is None:
+                    continue
+                if label.winfo_ismapped():
+                    preview = self._draw_preview(('category', category_name), label, preview,
+                                                 CATEGORY_THUMBNAIL_SIZE, 'category_thumbnail')
+                if preview is not None:
+                    hidden_thumbnails[category_name] = preview
+            
+            # Keep unseen images unless a newer one arrived meanwhile
+            with self._ui_lock:
+                for position, preview in hidden_previews.items():
+                    self._pending_previews.setdefault(position, preview)
+                for category_name, preview in hidden_thumbnails.items():
+                    self._pending_thumbnails.setdefault(category_name, preview)
+        except Exception as e:
+            print(f"Error refreshing UI: {e}")
+        finally:
+            self.root.after(UI_REFRESH_MS, self._refresh_ui)
+    
+    def _draw_preview(self, slot, label, preview, size, stage):
+        """
+        Draw a pending preview in label (Tk thread): the worker's JPEG bytes or a
+        decoded image. The path of a file answered from the cache is decoded on
+        the preview loader thread instead and drawn by a later refresh.
+        Returns: the preview if it has to stay pending, else None
+        """
+        if isinstance(preview, str):
+            with self._ui_lock:
+                if slot in self._preview_loading:
+                    return preview  # One decode per panel at a time
+                self._preview_loading.add(slot)
+            self._preview_loader.submit(self._load_preview, slot, preview, size, self._scan_generation)
+            return None
         
-        # Update label
-        self.root.after(0, lambda: label.configure(image=img_tk))
-        self.root.after(0, lambda: setattr(label, 'image_tk', img_tk))
+        started = time.perf_counter()
+        img = decode_preview(preview) if isinstance(preview, bytes) else preview
+        if img is not None:
+            self._render_image(label, img, size[0], size[1])
+        self.stage_timer.add(stage, time.perf_counter() - started)
+        return None
+    
+    def _load_preview(self, slot, image_path, size, generation):
+        """Decode the preview of a cached file (preview loader thread) for the next UI refresh"""
+        try:
+            img = load_preview(image_path, size)
+        except Exception as e:
+            print(f"Error loading preview {image_path}: {e}")
+            img = None
+        with self._ui_lock:
+            self._preview_loading.discard(slot)
+            if img is None or generation != self._scan_generation:
+                return
+            pending = self._pending_previews if slot[0] == 'pane' else self._pending_thumbnails
+            pending.setdefault(slot[1], img)  # A newer preview wins
+    
+    def _render_image(self, label, img, width, height):
+        """Fit img into width x height and show it in label (Tk thread only)"""
+        img_tk = ImageTk.PhotoImage(Image.fromarray(self.resize_image(img, width, height)))
+        label.configure(image=img_tk)
+        label.image_tk = img_tk
     
     def resize_image(self, img, width, height):
         """Resize image to fit dimensions while preserving aspect ratio"""
@@ -2426,9 +2408,11 @@ class AdobeStockChecker:
     
     def update_progress(self):
         """Update progress indicators"""
+        self.progress_bar["maximum"] = self.total_images
         self.progress_bar["value"] = self.processed_images
         self.progress_label.config(
             text=f"Processed {self.processed_images} of {self.total_images} images"
+                 f"  (queued: {self.work_queue.qsize()} to check, {self.file_stage.depth()} to move)"
         )
     
     def finalize_processing(self):
@@ -2437,8 +2421,9 @@ class AdobeStockChecker:
         self.start_btn.config(text="Start Processing", bootstyle="success")
         self.stop_timer()
         
-        # Update category counts
-        self.update_category_counts()
+        # Update category counts (recounted once, now that every move is done)
+        self.update_progress()
+        self.reconcile_category_counts()
         
         # Record end time and display total duration
         if self.start_time:
@@ -2449,142 +2434,428 @@ class AdobeStockChecker:
             
             end_time_str = f"Total Time: {hours:02d}:{minutes:02d}:{seconds:02d}"
             self.timer_label.config(text=end_time_str)
+            self.rate_label.config(text=f"{self.processed_images / max(elapsed, 1e-9):.1f} images/s")
+            
+            # Save where the time went, for comparing runs
+            message = f"Processed {self.processed_images} images in {end_time_str}"
+            if self.selected_folder:
+                summary = build_run_summary(
+                    self.selected_folder, self.start_time, elapsed, self.processed_images, self.total_images,
+                    self.run_categories, self.num_cores, self.stage_timer, file_workers=len(self.file_stage.threads)
+                )
+                summary_path = write_run_summary(self.selected_folder, summary)
+                if summary_path:
+                    message += f"\n\nTimings saved to {os.path.basename(summary_path)}"
             
             # Show completion message
-            messagebox.showinfo(
-                "Processing Complete", 
-                f"Processed {self.processed_images} images in {end_time_str}"
-            )
+            messagebox.showinfo("Processing Complete", message)
     
-    def process_results(self):
-        """Handle results from the result queue"""
-        while True:
+    def process_result(self, result):
+        """Move one classified image to its category folder (runs on a file stage thread)"""
+        # Get category and path
+        category_id = result['category']
+        category_name = self.categories[category_id]
+        image_path = result['path']
+        
+        # Create destination path
+        if self.selected_folder:
+            dest_folder = os.path.join(self.selected_folder, category_name)
+            
             try:
-                # Get result
-                result = self.result_queue.get()
+                # Worker's JPEG preview (for display)
+                preview = result.get('preview')
                 
-                # Skip errors
-                if result.get('error'):
-                    self.result_queue.task_done()
-                    continue
-                
-                # Get category and path
-                category_id = result['category']
-                category_name = self.categories[category_id]
-                image_path = result['path']
+                # Move file to appropriate folder and strip its metadata
+                started = time.perf_counter()
+                dest_path = move_and_strip(image_path, dest_folder)
+                self.stage_timer.add('move_strip', time.perf_counter() - started)
                 
-                # Create destination path
-                if self.selected_folder:
-                    dest_folder = os.path.join(self.selected_folder, category_name)
-                    dest_path = os.path.join(dest_folder, os.path.basename(image_path))
-                    
-                    try:
-                        # Make a copy of the image before moving (for display)
-                        img = imread_unicode(image_path)
-                        
-                        # Move file to appropriate folder
-                        shutil.move(image_path, dest_path)
-                        
-                        # Remove metadata from the moved file (in-place)
-                        self.remove_metadata_from_file(dest_path)
-                        
-                        # Store the moved image path for the category
-                        self.last_processed[category_name] = dest_path
-                        
-                        # Update thumbnail with the moved image
-                        if img is not None:
-                            self.update_category_thumbnail(category_name, img)
-                    except Exception as e:
-                        print(f"Error moving file: {e}")
+                # Re-key the cached analysis at its new path and mtime
+                cache = self.analysis_cache
+                if cache:
+                    cache.record_path(dest_path, result.get('content_key'), old_path=image_path)
                 
-                # Mark task complete
-                self.result_queue.task_done()
+                # Store the moved image path for the category
+                self.last_processed[category_name] = dest_path
+                self.adjust_category_counts({category_name: 1})
                 
+                # Update thumbnail with the moved image
+                self.update_category_thumbnail(category_name, preview or dest_path)
             except Exception as e:
-                print(f"Error processing result: {e}")
-                time.sleep(0.1)
+                print(f"Error moving file: {e}")
     
-    def update_category_thumbnail(self, category_name, img):
-        """Update thumbnail in category panel"""
+    def update_category_thumbnail(self, category_name, preview):
+        """Update thumbnail in category panel from JPEG preview bytes or an image path (drawn by the next UI refresh, latest image wins)"""
         if category_name not in self.category_labels:
             return
         
-        # ปรับขนาด thumbnail ให้เข้ากับหน้าจอที่เล็กลง
-        width = 400  # ปรับตามความเหมาะสม
-        height = 200  # ปรับตามความเหมาะสม
-        
-        # Resize for display
-        thumb = self.resize_image(img, width, height)
-        
-        # Convert to tkinter format
-        thumb_tk = ImageTk.PhotoImage(Image.fromarray(thumb))
-        
-        # Update label
-        label = self.category_labels[category_name]
-        self.root.after(0, lambda: label.configure(image=thumb_tk))
-        self.root.after(0, lambda: setattr(label, 'image_tk', thumb_tk))
-        
-        # Update category count
-        self.root.after(0, self.update_category_counts)
+        with self._ui_lock:
+            self._pending_thumbnails[category_name] = preview
     
-def prepare_image(image_path):
+def read_image_header(image_path):
+    """
+    Read image size, alpha presence and EXIF orientation from the file header without decoding pixels.
+    Returns: tuple (width, height, has_alpha, orientation), or None if the header can't be read
+    """
+    try:
+        with Image.open(image_path) as pil_img:
+            has_alpha = pil_img.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') or 'transparency' in pil_img.info
+            orientation = pil_img.getexif().get(0x0112, 1)
+            return pil_img.width, pil_img.height, has_alpha, orientation
+    except Exception:
+        return None
+
+
+def analysis_reduction(width, height):
+    """Largest decode reduction (1, 2, 4 or 8) that keeps ANALYSIS_MIN_SIDE on the long side"""
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if long_side // factor >= ANALYSIS_MIN_SIDE:
+            return factor
+    return 1
+
+
+_REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+_GRAYSCALE_DECODE_EXTENSIONS = ('.jpg', '.jpeg')  # Grayscale decode gives the same luma as a color decode
+
+_REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def prepare_image(image_path, analysis=False, color=False, header=None):
     """
     Load image and handle PNG transparency by compositing onto a white background.
     Also handles grayscale images by converting to BGR.
-    Returns: tuple (BGR image (numpy array), has_transparency (bool))
+    
+    With analysis=True the image is only decoded as far as the border and
+    duplicate checks need: grayscale (BGR if color=True, for previews),
+    reduced 2/4/8x from the header size (JPEG is scaled inside the DCT decode),
+    and alpha is only decoded when the file actually has an alpha channel.
+    Pass header if the caller already has read_image_header() for this file.
+    
+    Returns: tuple (BGR image, or grayscale image in analysis mode (numpy array), has_transparency (bool))
+    """
+    if analysis:
+        if header is None:
+            header = read_image_header(image_path)
+        if header is not None and not header[2]:
+            # No alpha channel: let the decoder produce the reduced image directly
+            # Only JPEG decodes straight to gray with BT.601 luma (its Y channel); libpng and
+            # libtiff use other weights, which would move the pHash, so those are decoded in
+            # color and converted like the full-size path
+            factor = analysis_reduction(header[0], header[1])
+            gray_decode = not color and os.path.splitext(image_path)[1].lower() in _GRAYSCALE_DECODE_EXTENSIONS
+            flags = (_REDUCED_GRAYSCALE_FLAGS if gray_decode else _REDUCED_COLOR_FLAGS)[factor]
+            img = imread_unicode(image_path, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+            if img is not None and not color and not gray_decode:
+                img = _to_gray(img)
+            return img, False
+        
+        # Alpha (or unknown header): composite at full size, then reduce
+        img, has_transparency = _decode_composited(image_path)
+        if img is None:
+            return None, False
+        img = _to_bgr(img) if color else _to_gray(img)
+        factor = analysis_reduction(img.shape[1], img.shape[0])
+        if factor > 1:
+            img = cv2.resize(img, (img.shape[1] // factor, img.shape[0] // factor), interpolation=cv2.INTER_AREA)
+        return img, has_transparency
+    
+    img, has_transparency = _decode_composited(image_path)
+    if img is None:
+        return None, False
+    return _to_bgr(img), has_transparency
+
+
+_COMPOSITE_BAND_PIXELS = 1 << 16  # Rows are composited in cache-sized bands of about this many pixels
+
+
+def _composite_on_white(img):
+    """
+    Composite an image with alpha in its last channel onto white, in place.
+    Uses uint16 fixed-point math over row bands, so no full-size float arrays
+    are created: out = 255 - ceil(alpha * (255 - c) / 255), the exact integer
+    form of the previous float formula truncated to uint8.
+    Returns: has_transparency (any alpha below 0.99)
+    """
+    alpha = img[:, :, -1]
+    # alpha / 255 < 0.99  <=>  alpha <= 252; min() needs no boolean temporary
+    if alpha.min() > 252:
+        return False
+    
+    height, width, channels = img.shape
+    rows = max(1, _COMPOSITE_BAND_PIXELS // width)
+    band = np.empty((rows, width, channels - 1), dtype=np.uint16)
+    scratch = np.empty_like(band)
+    
+    for y in range(0, height, rows):
+        color = img[y:y + rows, :, :-1]
+        band_alpha = img[y:y + rows, :, -1]
+        
+        # Fully opaque bands keep their color, fully transparent bands become white
+        if band_alpha.min() == 255:
+            continue
+        if band_alpha.max() == 0:
+            color[:] = 255
+            continue
+        
+        t = band[:color.shape[0]]
+        s = scratch[:color.shape[0]]
+        
+        np.subtract(255, color, out=t, dtype=np.uint16)    # 255 - c
+        np.multiply(t, img[y:y + rows, :, -1:], out=t)      # * alpha (max 65025)
+        t += 254                                            # round up: ceil(x / 255) = (x + 254) // 255
+        np.right_shift(t, 8, out=s)                         # exact x // 255 for x < 65535:
+        t += s                                              #   (x + (x >> 8) + 1) >> 8
+        t += 1
+        t >>= 8
+        np.subtract(255, t, out=color, casting='unsafe')
+    
+    return True
+
+
+def _decode_composited(image_path):
+    """
+    Decode an image unchanged and composite any alpha channel onto white in place.
+    Returns: tuple (image that may still carry its alpha channel, has_transparency)
     """
     img = imread_unicode(image_path, cv2.IMREAD_UNCHANGED)
     if img is None:
         return None, False
     
-    # Handle different channel counts
-    if len(img.shape) == 2:
-        # Grayscale image (1 channel) - convert to BGR
-        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), False
-    
-    if img.shape[2] == 1:
-        # Single channel image - convert to BGR
-        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), False
-    
-    if img.shape[2] == 2:
-        # Grayscale with alpha - composite onto white then convert
-        gray = img[:, :, 0]
-        alpha = img[:, :, 1] / 255.0
-        # Check if there's actual transparency (not all fully opaque)
-        has_transparency = np.any(alpha < 0.99)
-        background = np.ones(gray.shape, dtype=np.uint8) * 255
-        composited = (alpha * gray + (1 - alpha) * background).astype(np.uint8)
-        return cv2.cvtColor(composited, cv2.COLOR_GRAY2BGR), has_transparency
-    
-    if img.shape[2] == 4:
-        # BGRA image - composite onto white background
-        alpha = img[:, :, 3] / 255.0
-        # Check if there's actual transparency (not all fully opaque)
-        has_transparency = np.any(alpha < 0.99)
-        background = np.ones((img.shape[0], img.shape[1], 3), dtype=np.uint8) * 255
-        for c in range(0, 3):
-            background[:, :, c] = (alpha * img[:, :, c] + (1 - alpha) * background[:, :, c]).astype(np.uint8)
-        return background, has_transparency
+    # 16-bit images are reduced to 8 bits; every check works on 8-bit levels
+    if img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
     
+    has_transparency = False
+    if img.ndim == 3 and img.shape[2] in (2, 4):
+        has_transparency = _composite_on_white(img)
+    return img, has_transparency
+
+
+def _to_bgr(img):
+    """Convert a decoded (and composited) image to 3-channel BGR"""
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    channels = img.shape[2]
+    if channels in (1, 2):
+        # Grayscale (with alpha) - convert to BGR
+        return cv2.cvtColor(np.ascontiguousarray(img[:, :, 0]), cv2.COLOR_GRAY2BGR)
+    if channels == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
     # If it's already 3 channels (BGR)
-    return img, False
+    return img
 
 
-def check_duplicate_standalone(img, image_path, existing_hashes):
+def _to_gray(img):
+    """Convert a decoded (and composited) image to single-channel grayscale"""
+    if img.ndim == 2:
+        return img
+    channels = img.shape[2]
+    if channels in (1, 2):
+        return np.ascontiguousarray(img[:, :, 0])
+    if channels == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+# ===== Duplicate hash index =====
+HASH_WORDS = (HASH_SIZE * HASH_SIZE + 63) // 64  # pHash packed into uint64 words (4 for HASH_SIZE=16)
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values):
+    """Per-element bit count of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    # NumPy < 2.0: count bits byte by byte
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming_distance(a, b):
+    """Hamming distance between two hashes packed into Python ints"""
+    return bin(a ^ b).count('1')
+
+
+def pack_hash(hash_str):
+    """Pack a pHash hex string into HASH_WORDS uint64 words"""
+    data = bytes.fromhex(hash_str).rjust(HASH_WORDS * 8, b'\x00')
+    return np.frombuffer(data, dtype='>u8').astype(np.uint64)
+
+
+def group_hashes_by_similarity(hash_strs, threshold=SIMILARITY_THRESHOLD, block_size=256):
     """
-    Check if image is a duplicate using perceptual hash.
-    Based on PhotoSweep's approach with imagehash.hex_to_hash() for proper Hamming distance.
+    Group hashes whose Hamming distance is within the threshold.
     
-    Args:
-        img: BGR image (numpy array)
-        image_path: path to current image
-        existing_hashes: dict of {path: hash_string}
+    Hashes are packed into a uint64 matrix and compared block by block with
+    XOR + popcount, so each block's temporaries stay cache-sized. Pairs within
+    the threshold are joined with union-find, which makes the grouping
+    transitive and independent of the input order.
     
-    Returns:
-        tuple (is_duplicate: bool, hash_string: str)
+    Returns: list of groups (lists of indices into hash_strs), in order of first appearance
+    """
+    n = len(hash_strs)
+    if n == 0:
+        return []
+    
+    packed = np.stack([pack_hash(h) for h in hash_strs])
+    parent = list(range(n))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for start_a in range(0, n, block_size):
+        block_a = packed[start_a:start_a + block_size]
+        for start_b in range(start_a, n, block_size):
+            block_b = packed[start_b:start_b + block_size]
+            
+            # Accumulate the distance one word at a time to keep temporaries 2-D
+            distances = np.zeros((len(block_a), len(block_b)), dtype=np.uint16)
+            for word in range(HASH_WORDS):
+                distances += popcount64(block_a[:, word, None] ^ block_b[None, :, word])
+            
+            close = distances <= threshold
+            if start_a == start_b:
+                close = np.triu(close, k=1)
+            
+            for i, j in zip(*np.nonzero(close)):
+                root_a, root_b = find(start_a + i), find(start_b + j)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+    
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+class HashIndex:
+    """
+    Parent-side index of the perceptual hashes committed in a run.
+    
+    Uses multi-index hashing: the hash is split into threshold + 1 bit chunks,
+    and by the pigeonhole principle any hash within the threshold matches at
+    least one chunk exactly. A lookup only verifies the hashes sharing a chunk
+    bucket, so it stays flat as the folder grows instead of scanning every hash.
+    """
+    
+    def __init__(self, hashes=None, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        
+        # (shift, mask) of each chunk, widths as equal as possible
+        bits = HASH_WORDS * 64
+        num_chunks = max(1, min(threshold + 1, bits))
+        self._chunk_layout = []
+        shift = 0
+        for i in range(num_chunks):
+            width = bits // num_chunks + (1 if i < bits % num_chunks else 0)
+            self._chunk_layout.append((shift, (1 << width) - 1))
+            shift += width
+        
+        self.clear()
+        for path, hash_str in (hashes or {}).items():
+            self.add(path, hash_str)
+    
+    def clear(self):
+        with self.lock:
+            self.paths = []
+            self.values = []
+            self.positions = {}
+            self.buckets = [{} for _ in self._chunk_layout]
+    
+    def __len__(self):
+        return len(self.positions)
+    
+    def add(self, path, hash_str):
+        with self.lock:
+            self._add(path, int(hash_str, 16))
+    
+    def find_match(self, hash_str, exclude_path=None):
+        """Return the path of a stored hash within the threshold, or None"""
+        with self.lock:
+            return self._find(int(hash_str, 16), exclude_path)
+    
+    def commit(self, result):
+        """
+        Check a worker result against the index and store its hash.
+        Marks the result as duplicate when a similar image was committed earlier,
+        with the earlier image's path in result['duplicate_of'].
+        Returns: True if the result is a duplicate
+        """
+        hash_str = result.get('phash')
+        if not hash_str:
+            return False
+        
+        value = int(hash_str, 16)
+        with self.lock:
+            match = self._find(value, result['path'])
+            self._add(result['path'], value)
+        
+        is_duplicate = match is not None
+        if is_duplicate:
+            result['is_good'] = False
+            result['category'] = 'duplicate'
+            result['duplicate_of'] = match
+        return is_duplicate
+    
+    def _chunks(self, value):
+        return [(value >> shift) & mask for shift, mask in self._chunk_layout]
+    
+    def _add(self, path, value):
+        position = self.positions.get(path)
+        if position is not None:
+            # Re-hashed path: drop it from the buckets of its old value
+            for bucket, key in zip(self.buckets, self._chunks(self.values[position])):
+                bucket[key].remove(position)
+            self.values[position] = value
+        else:
+            position = len(self.paths)
+            self.paths.append(path)
+            self.values.append(value)
+            self.positions[path] = position
+        
+        for bucket, key in zip(self.buckets, self._chunks(value)):
+            bucket.setdefault(key, []).append(position)
+    
+    def _find(self, value, exclude_path):
+        checked = set()
+        for bucket, key in zip(self.buckets, self._chunks(value)):
+            for position in bucket.get(key, ()):
+                if position in checked:
+                    continue
+                checked.add(position)
+                if hamming_distance(value, self.values[position]) <= self.threshold:
+                    path = self.paths[position]
+                    if path != exclude_path:
+                        return path
+        return None
+
+
+def compute_phash(img):
     """
-    # Convert to PIL for hashing
-    pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    Calculate the perceptual hash of a BGR or grayscale image.
+    Returns: hash as hex string
+    """
+    # Convert to PIL for hashing (pHash only uses luminance, so grayscale is hashed as-is)
+    if img.ndim == 2:
+        pil_img = Image.fromarray(img)
+    else:
+        pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
     
     # Resize large images to avoid MemoryError (PhotoSweep approach)
     max_dim = 2048
@@ -2594,38 +2865,129 @@ def check_duplicate_standalone(img, image_path, existing_hashes):
         pil_img = pil_img.resize(new_size, Image.LANCZOS)
     
     # Convert to RGB if needed
-    if pil_img.mode != 'RGB':
+    if pil_img.mode not in ('RGB', 'L'):
         pil_img = pil_img.convert('RGB')
     
     # Calculate perceptual hash with larger hash_size for more accuracy
-    current_hash = imagehash.phash(pil_img, hash_size=HASH_SIZE)
-    current_hash_str = str(current_hash)
+    return str(imagehash.phash(pil_img, hash_size=HASH_SIZE))
+
+
+def check_duplicate_standalone(img, image_path, existing_hashes):
+    """
+    Check if image is a duplicate using perceptual hash.
+    Based on PhotoSweep's approach, with Hamming distance over packed hashes.
     
-    # Compare with existing hashes using proper Hamming distance
-    for path, stored_hash_str in existing_hashes.items():
-        if path == image_path:
-            continue
-        
-        try:
-            # Use imagehash.hex_to_hash for proper comparison (PhotoSweep method)
-            stored_hash = imagehash.hex_to_hash(stored_hash_str)
-            distance = current_hash - stored_hash  # Hamming distance
-            
-            if distance <= SIMILARITY_THRESHOLD:
-                return True, current_hash_str
-        except Exception:
-            # If hash comparison fails, skip this comparison
-            pass
+    Args:
+        img: BGR or grayscale image (numpy array)
+        image_path: path to current image
+        existing_hashes: HashIndex, or dict of {path: hash_string}
+    
+    Returns:
+        tuple (is_duplicate: bool, hash_string: str)
+    """
+    current_hash_str = compute_phash(img)
     
-    return False, current_hash_str
+    if not isinstance(existing_hashes, HashIndex):
+        existing_hashes = HashIndex(existing_hashes)
+    
+    is_duplicate = existing_hashes.find_match(current_hash_str, image_path) is not None
+    return is_duplicate, current_hash_str
+
+def apply_exif_orientation(img, orientation):
+    """Rotate/flip a decoded image the way its EXIF orientation tag says it should be shown"""
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def fit_image(img, width, height):
+    """Shrink image to fit within width x height, preserving aspect ratio (never enlarges)"""
+    h, w = img.shape[:2]
+    scale = min(width / w, height / h)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def encode_preview(img, size, orientation=1):
+    """Fit a BGR image into size, orient it for display and encode it as compact JPEG bytes"""
+    preview = apply_exif_orientation(fit_image(img, size[0], size[1]), orientation)
+    ok, buf = cv2.imencode('.jpg', preview, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes() if ok else None
+
 
-def check_image_standalone(image_path, position, existing_hashes):
+def decode_preview(data):
+    """Decode preview bytes returned by a worker. Returns: BGR image or None"""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def load_preview(image_path, size):
+    """Decode an image reduced and in color, fitted to size and oriented for display. Returns: BGR image or None"""
+    header = read_image_header(image_path)
+    img, _ = prepare_image(image_path, analysis=True, color=True, header=header)
+    if img is None:
+        return None
+    return apply_exif_orientation(fit_image(img, size[0], size[1]), header[3] if header else 1)
+
+
+def check_image_standalone(image_path, position, preview_size=None, cache_path=None, thumbnail_sizes=None, with_key=False):
     """
     Standalone function to be run in a separate process.
+    Returns the border verdict and the perceptual hash; the duplicate check
+    against other images is done by the parent with HashIndex.commit().
+    
+    With preview_size=(width, height) the image is decoded in color and a
+    JPEG preview fitting that size is returned in result['preview'], so the
+    parent never has to decode the original file again.
+    
+    With thumbnail_sizes (largest first) the gallery thumbnails are made from
+    the same decode and returned as {size: JPEG bytes} in result['thumbnails'],
+    for AnalysisCache.store_thumbnail().
+    
+    With cache_path the file's content_key() is looked up in that
+    AnalysisCache first, and a stored analysis is returned without decoding
+    (unless a thumbnail that is not stored yet is wanted). Such results have
+    no preview; the parent decodes one only if it is going to be drawn.
+    The key reads the whole file, so without a cache it is only computed
+    when with_key=True (e.g. for a plan manifest).
+    
+    result['timings'] holds the seconds spent in each step, for StageTimer.
     """
     try:
-        # 1. Prepare image (handle transparency)
-        img, has_transparency = prepare_image(image_path)
+        timings = {}
+        key = None
+        if cache_path or with_key:
+            started = time.perf_counter()
+            key = content_key(image_path)
+            timings['content_key'] = time.perf_counter() - started
+        if cache_path:
+            cache = open_worker_cache(cache_path)
+            analysis = cache.lookup_key(key)
+            if analysis is not None and all(cache.lookup_thumbnail(key, size) for size in thumbnail_sizes or ()):
+                result = result_from_analysis(image_path, position, analysis)
+                result['timings'] = timings
+                return result
+        
+        # 1. Prepare image (handle transparency), decoded reduced and grayscale for analysis
+        started = time.perf_counter()
+        header = read_image_header(image_path)
+        color = bool(preview_size or thumbnail_sizes)
+        img, has_transparency = prepare_image(image_path, analysis=True, color=color, header=header)
+        timings['decode'] = time.perf_counter() - started
         if img is None:
             return {'error': True, 'path': image_path}
             
@@ -2636,26 +2998,53 @@ def check_image_standalone(image_path, position, existing_hashes):
             'is_good': True,
             'category': 'good',
             'error': False,
-            'new_hashes': {}
+            'phash': None,
+            'preview': None,
+            'content_key': key,
+            'border': None,
+            'width': header[0] if header else None,
+            'height': header[1] if header else None,
+            'cached': None,
+            'border_stats': None,
+            'timings': timings
         }
         
-        # 2. Check for duplicates
-        is_duplicate, hashes = check_duplicate_standalone(img, image_path, existing_hashes)
-        result['new_hashes'] = {image_path: hashes}
-        
-        if is_duplicate:
-            result['is_good'] = False
-            result['category'] = 'duplicate'
-            return result
+        orientation = header[3] if header else 1
+        if preview_size:
+            started = time.perf_counter()
+            result['preview'] = encode_preview(img, preview_size, orientation)
+            timings['preview_encode'] = time.perf_counter() - started
+        
+        if thumbnail_sizes:
+            # Each thumbnail is shrunk from the previous (larger) one
+            started = time.perf_counter()
+            thumb = apply_exif_orientation(img, orientation)
+            result['thumbnails'] = {}
+            for size in thumbnail_sizes:
+                thumb = fit_image(thumb, size[0], size[1])
+                result['thumbnails'][tuple(size)] = encode_preview(thumb, size)
+            timings['thumbnail_encode'] = time.perf_counter() - started
+        
+        if color:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        
+        # 2. Hash for the duplicate check
+        started = time.perf_counter()
+        result['phash'] = compute_phash(img)
+        timings['phash'] = time.perf_counter() - started
             
         # 3. Check for borders using standalone function
         # Skip border detection for transparent PNGs as the transparent area 
         # becomes white after compositing and would be wrongly detected as white border
         if not has_transparency:
-            border_type = detect_border_standalone(img)
+            started = time.perf_counter()
+            result['border_stats'] = {}
+            border_type = detect_border_standalone(img, result['border_stats'])
+            timings['border'] = time.perf_counter() - started
             if border_type:
                 result['is_good'] = False
                 result['category'] = border_type
+                result['border'] = border_type
                 return result
             
         return result
@@ -2663,89 +3052,2053 @@ def check_image_standalone(image_path, position, existing_hashes):
     except Exception as e:
         return {'error': True, 'path': image_path, 'exception': str(e)}
 
-def detect_border_standalone(img):
+_GRAY_LEVELS = np.arange(256, dtype=np.float64)
+
+
+def _region_stats(region):
+    """
+    Histogram-based statistics of a grayscale region from a single pass.
+    Returns: tuple (histogram, pixel count, mean, std), or None for an empty region
+    """
+    hist = cv2.calcHist([region], [0], None, [256], [0, 256]).ravel()
+    count = hist.sum()
+    if not count:
+        return None
+    mean = hist @ _GRAY_LEVELS / count
+    variance = hist @ (_GRAY_LEVELS * _GRAY_LEVELS) / count - mean * mean
+    return hist, count, mean, math.sqrt(max(variance, 0.0))
+
+
+def detect_border_standalone(img, stats=None):
     """
     Standalone version of detect_border_type logic.
-    Optimized for execution in separate processes.
+    Optimized for execution in separate processes: each border side is read
+    once into a histogram that gives its mean, std and black/white fractions,
+    and the interior is only measured when a border could still qualify.
+    
+    If a stats dict is given, it is filled with the per-side measurements
+    (top, bottom, left, right) and, when read, the interior's.
     """
-    # Convert to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # Convert to grayscale (analysis images are already grayscale)
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if gray.dtype != np.uint8:
+        gray = cv2.convertScaleAbs(gray, alpha=255.0 / np.iinfo(gray.dtype).max)
     height, width = gray.shape
     
     # Calculate border margins (5% of image)
     margin_h = max(int(height * 0.05), 10)
     margin_w = max(int(width * 0.05), 10)
     
-    # Extract border regions
-    top = gray[:margin_h, :]
-    bottom = gray[-margin_h:, :]
-    left = gray[:, :margin_w]
-    right = gray[:, -margin_w:]
-    
-    # Extract interior region (everything except borders)
-    interior = gray[margin_h:height-margin_h, margin_w:width-margin_w]
-    
-    # Calculate means and stds
-    border_regions = [top, bottom, left, right]
-    border_means = [np.mean(region) for region in border_regions]
-    interior_mean = np.mean(interior)
-    border_stds = [np.std(region) for region in border_regions]
-    
     # Thresholds
     black_threshold = 15
     white_threshold = 245
     std_threshold = 8
-    edge_threshold = 0.1
+    
+    # Per-side statistics: top, bottom, left, right
+    sides = [_region_stats(region) for region in (
+        gray[:margin_h, :],
+        gray[-margin_h:, :],
+        gray[:, :margin_w],
+        gray[:, -margin_w:]
+    )]
+    if any(side is None for side in sides):
+        return None
+    
+    border_means = [side[2] for side in sides]
+    border_stds = [side[3] for side in sides]
+    black_pcts = [side[0][:black_threshold + 1].sum() / side[1] for side in sides]
+    white_pcts = [side[0][white_threshold:].sum() / side[1] for side in sides]
+    if stats is not None:
+        stats['means'] = [round(float(v), 2) for v in border_means]
+        stats['stds'] = [round(float(v), 2) for v in border_stds]
+        stats['black_pcts'] = [round(float(v), 4) for v in black_pcts]
+        stats['white_pcts'] = [round(float(v), 4) for v in white_pcts]
+    
+    def opposite_sides_match(pcts):
+        # Top+bottom or left+right mostly at the level, with a flat (low std) border
+        return ((pcts[0] > 0.95 and pcts[1] > 0.95 and border_stds[0] < std_threshold and border_stds[1] < std_threshold) or
+                (pcts[2] > 0.95 and pcts[3] > 0.95 and border_stds[2] < std_threshold and border_stds[3] < std_threshold))
+    
+    is_black = opposite_sides_match(black_pcts)
+    is_white = opposite_sides_match(white_pcts)
+    
+    # Early exit: most images have no flat border, so the interior is never read
+    if not is_black and not is_white:
+        return None
+    
+    # Extract interior region (everything except borders)
+    interior = _region_stats(gray[margin_h:height-margin_h, margin_w:width-margin_w])
+    if interior is None:
+        return None
+    interior_hist, interior_count, interior_mean, _ = interior
+    if stats is not None:
+        stats['interior_mean'] = round(float(interior_mean), 2)
+    border_mean = np.mean(border_means)
     
     # 1. Check for Black Borders
-    top_black_pct = np.sum(top <= black_threshold) / top.size
-    bottom_black_pct = np.sum(bottom <= black_threshold) / bottom.size
-    left_black_pct = np.sum(left <= black_threshold) / left.size
-    right_black_pct = np.sum(right <= black_threshold) / right.size
-    
-    is_black = False
-    if (top_black_pct > 0.95 and bottom_black_pct > 0.95 and border_stds[0] < std_threshold and border_stds[1] < std_threshold):
-        is_black = True
-    elif (left_black_pct > 0.95 and right_black_pct > 0.95 and border_stds[2] < std_threshold and border_stds[3] < std_threshold):
-        is_black = True
-        
-    if is_black and abs(interior_mean - np.mean(border_means)) > 40:
+    if is_black and abs(interior_mean - border_mean) > 40:
         return 'black'
-        
-    # 2. Check for White Borders
-    top_white_pct = np.sum(top >= white_threshold) / top.size
-    bottom_white_pct = np.sum(bottom >= white_threshold) / bottom.size
-    left_white_pct = np.sum(left >= white_threshold) / left.size
-    right_white_pct = np.sum(right >= white_threshold) / right.size
     
+    # 2. Check for White Borders
     # Check if interior is also very white (e.g., sticker on white background)
-    # If interior is mostly white, it's NOT a white border issue
-    interior_white_pct = np.sum(interior >= white_threshold) / interior.size
-    
-    is_white = False
-    if (top_white_pct > 0.95 and bottom_white_pct > 0.95 and border_stds[0] < std_threshold and border_stds[1] < std_threshold):
-        is_white = True
-    elif (left_white_pct > 0.95 and right_white_pct > 0.95 and border_stds[2] < std_threshold and border_stds[3] < std_threshold):
-        is_white = True
-    
-    # Additional check: if interior is also very white (>50%), skip white border detection
+    # If interior is mostly white (>50%), it's NOT a white border issue
     # This prevents false positives for stickers, logos on white backgrounds
+    interior_white_pct = interior_hist[white_threshold:].sum() / interior_count
+    if stats is not None:
+        stats['interior_white_pct'] = round(float(interior_white_pct), 4)
     if interior_white_pct > 0.50:
         is_white = False
         
-    if is_white and abs(interior_mean - np.mean(border_means)) > 40:
+    if is_white and abs(interior_mean - border_mean) > 40:
         return 'white'
         
     return None
-if __name__ == "__main__":
-    # Required for multiprocessing support in compiled (.exe) Windows apps
-    multiprocessing.freeze_support()
-    
-    # Create main window
-    root = ttk.Window(themename="darkly")
+
+
+# ===== Metadata removal =====
+COPY_BUFFER_SIZE = 1 << 20  # Kept segments are copied in chunks of this size, so memory per file is constant
+
+
+def remove_metadata_from_file(filepath):
+    """
+    Remove metadata from image file (in-place).
+    Based on MetaSweep Pro's approach.
     
-    # สร้างแอปพลิเคชัน
-    app = AdobeStockChecker(root)
+    Only the segment/chunk headers (TIFF: the IFDs) are parsed; the kept
+    bytes are copied into a temporary file next to the original, which then
+    atomically replaces it, so a crash never leaves a half-written image.
+    Pixels are never decoded, and files without metadata are not rewritten.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            parts = _metadata_kept_parts(f, filepath)
+        if parts != [(0, size)]:
+            _rewrite_parts(filepath, parts)
+    except Exception as e:
+        print(f"Error removing metadata from {filepath}: {e}")
+
+
+# Markers to REMOVE for complete clean sweep
+_JPEG_METADATA_MARKERS = {
+    0xE1,  # APP1 - EXIF/XMP
+    0xE2,  # APP2 - ICC Profile
+    0xEB,  # APP11 - JUMBF/C2PA/Google AI
+    0xEC,  # APP12 - Picture Info
+    0xED,  # APP13 - IPTC/Photoshop
+    0xEE,  # APP14 - Adobe
+    0xFE,  # COM - Comments
+}
+
+# PNG chunks to keep (essential for image display)
+_PNG_KEEP_CHUNKS = {b'IHDR', b'PLTE', b'IDAT', b'IEND', b'tRNS', b'cHRM',
+                    b'gAMA', b'sBIT', b'bKGD', b'hIST', b'pHYs', b'sPLT'}
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _jpeg_kept_ranges(f, size):
+    """
+    Yield the (offset, length) ranges of an open JPEG that metadata removal
+    keeps, reading only the marker headers. Removes all metadata markers for
+    a complete clean sweep:
+    - 0xE1 (APP1): EXIF, XMP
+    - 0xE2 (APP2): ICC Profile  
+    - 0xEB (APP11): JUMBF, C2PA, Google Generative AI
+    - 0xEC (APP12): Picture Info
+    - 0xED (APP13): IPTC, Photoshop Resources
+    - 0xEE (APP14): Adobe
+    - 0xFE (COM): JPEG Comments
+    """
+    yield 0, 2  # SOI marker
     
-    # แสดงหน้าต่าง
-    root.mainloop()
+    i = 2
+    while i < size - 1:
+        f.seek(i)
+        header = f.read(4)
+        if header[0] != 0xff:
+            yield i, size - i
+            return
+            
+        marker = header[1]
+        
+        # SOS - Start of Scan (image data begins)
+        if marker == 0xda:
+            yield i, size - i
+            return
+            
+        # EOI - End of Image
+        if marker == 0xd9:
+            yield i, 2
+            return
+            
+        # Markers without length (RST0-RST7, SOI, EOI, TEM)
+        if marker in (0xd0, 0xd1, 0xd2, 0xd3, 0xd4, 0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0x01):
+            yield i, 2
+            i += 2
+            continue
+            
+        # Get segment length
+        if i + 3 >= size:
+            return
+        length = (header[2] << 8) + header[3]
+        
+        # Keep the segment unless it is metadata
+        if marker not in _JPEG_METADATA_MARKERS:
+            yield i, min(2 + length, size - i)
+        i += 2 + length
+
+
+def _png_kept_ranges(f, size):
+    """Yield the (offset, length) ranges of an open PNG that metadata removal keeps (essential chunks only)"""
+    yield 0, 8  # Signature
+    
+    i = 8
+    while i < size:
+        if i + 8 > size:
+            return
+            
+        f.seek(i)
+        header = f.read(8)
+        length = int.from_bytes(header[:4], 'big')
+        chunk_type = header[4:8]
+        chunk_size = 12 + length
+        
+        if i + chunk_size > size:
+            return
+            
+        # Keep only essential chunks
+        if chunk_type in _PNG_KEEP_CHUNKS:
+            yield i, chunk_size
+            
+        i += chunk_size
+
+
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+# TIFF tags removed from every IFD
+_TIFF_METADATA_TAGS = {
+    269,    # DocumentName
+    270,    # ImageDescription
+    271,    # Make
+    272,    # Model
+    285,    # PageName
+    305,    # Software
+    306,    # DateTime
+    315,    # Artist
+    316,    # HostComputer
+    700,    # XMP
+    33432,  # Copyright
+    33723,  # IPTC
+    34377,  # Photoshop Image Resources
+    34665,  # EXIF IFD
+    34675,  # ICC Profile
+    34853,  # GPS IFD
+    37724,  # ImageSourceData (Photoshop layers)
+    40965,  # Interoperability IFD
+    50341,  # PrintIM
+}
+
+# (offsets tag, byte counts tag) of the image data blocks that are relocated
+_TIFF_DATA_TAGS = (
+    (273, 279),  # StripOffsets, StripByteCounts
+    (324, 325),  # TileOffsets, TileByteCounts
+    (513, 514),  # JPEGInterchangeFormat, JPEGInterchangeFormatLength
+)
+
+# Other tags pointing into the file; TIFFs using them are left unchanged
+_TIFF_UNSUPPORTED_TAGS = {288, 289, 330, 400}  # FreeOffsets, FreeByteCounts, SubIFDs, GlobalParametersIFD
+
+
+def _tiff_kept_parts(f, size):
+    """
+    Rebuild a classic TIFF without its metadata tags, reading only the IFDs.
+    
+    The new file is the header and every IFD (with their out-of-line values)
+    followed by the strip/tile data, so the parts are the new header + IFDs
+    as bytes and the (offset, length) ranges of the data blocks, copied
+    unchanged. Removed tags (and the EXIF/GPS IFDs they point to) are
+    simply not copied, so their data is gone from the new file.
+    
+    Returns: list of parts, or None to keep the file as it is (no metadata,
+    BigTIFF, SubIFDs or anything else this rewriter can't relocate safely)
+    """
+    f.seek(0)
+    header = f.read(8)
+    order = '<' if header[:2] == b'II' else '>'
+    if len(header) < 8 or struct.unpack(order + 'H', header[2:4])[0] != 42:
+        return None  # BigTIFF (43) is left as-is
+    
+    # Read the IFD chain: (tag, type, count, value bytes) per entry
+    ifds = []
+    seen = set()
+    ifd_offset = struct.unpack(order + 'I', header[4:8])[0]
+    while ifd_offset:
+        if ifd_offset in seen or ifd_offset + 2 > size:
+            return None
+        seen.add(ifd_offset)
+        
+        f.seek(ifd_offset)
+        count = struct.unpack(order + 'H', f.read(2))[0]
+        raw = f.read(12 * count + 4)
+        if len(raw) < 12 * count + 4:
+            return None
+        
+        entries = []
+        for k in range(count):
+            tag, typ, n = struct.unpack(order + 'HHI', raw[12 * k:12 * k + 8])
+            field = raw[12 * k + 8:12 * k + 12]
+            if typ not in _TIFF_TYPE_SIZES:
+                return None
+            if tag in _TIFF_UNSUPPORTED_TAGS or (typ == 13 and tag not in _TIFF_METADATA_TAGS):
+                return None
+            
+            nbytes = _TIFF_TYPE_SIZES[typ] * n
+            if tag in _TIFF_METADATA_TAGS:
+                value = None  # Dropped, never read
+            elif nbytes > 4:
+                value_offset = struct.unpack(order + 'I', field)[0]
+                if value_offset + nbytes > size:
+                    return None
+                f.seek(value_offset)
+                value = f.read(nbytes)
+            else:
+                value = field[:nbytes]
+            entries.append((tag, typ, n, value))
+        
+        ifds.append(entries)
+        ifd_offset = struct.unpack(order + 'I', raw[12 * count:])[0]
+    
+    if not any(tag in _TIFF_METADATA_TAGS for entries in ifds for tag, _, _, _ in entries):
+        return None
+    
+    def read_values(entry):
+        tag, typ, n, value = entry
+        if typ not in (3, 4):
+            return None
+        return struct.unpack(order + ('H' if typ == 3 else 'I') * n, value)
+    
+    # Data blocks per IFD: {offsets tag: (offsets, byte counts)}
+    blocks = []
+    for entries in ifds:
+        by_tag = {entry[0]: entry for entry in entries}
+        ifd_blocks = {}
+        for offsets_tag, counts_tag in _TIFF_DATA_TAGS:
+            if offsets_tag not in by_tag:
+                continue
+            if counts_tag not in by_tag:
+                return None
+            offsets, counts = read_values(by_tag[offsets_tag]), read_values(by_tag[counts_tag])
+            if offsets is None or counts is None or len(offsets) != len(counts):
+                return None
+            if any(offset + length > size for offset, length in zip(offsets, counts)):
+                return None
+            ifd_blocks[offsets_tag] = (offsets, counts)
+        blocks.append(ifd_blocks)
+    
+    # New header and IFDs; offset values are patched once the data is placed
+    out = bytearray(header[:4] + struct.pack(order + 'I', 8))
+    patches = []  # (position in out, offsets tag, IFD index)
+    for index, entries in enumerate(ifds):
+        kept = [entry for entry in entries if entry[0] not in _TIFF_METADATA_TAGS]
+        ifd_pos = len(out)
+        out += struct.pack(order + 'H', len(kept))
+        out += bytes(12 * len(kept) + 4)
+        
+        for k, (tag, typ, n, value) in enumerate(kept):
+            if tag in blocks[index]:
+                typ, value = 4, bytes(4 * n)  # Offsets are rewritten as LONG
+            entry_pos = ifd_pos + 2 + 12 * k
+            if len(value) > 4:
+                out += bytes(len(out) & 1)  # Values start on a word boundary
+                value_pos = len(out)
+                out += value
+                field = struct.pack(order + 'I', value_pos)
+            else:
+                value_pos = entry_pos + 8
+                field = value.ljust(4, b'\x00')
+            struct.pack_into(order + 'HHI4s', out, entry_pos, tag, typ, n, field)
+            if tag in blocks[index]:
+                patches.append((value_pos, tag, index))
+        
+        if index + 1 < len(ifds):
+            out += bytes(len(out) & 1)
+            struct.pack_into(order + 'I', out, ifd_pos + 2 + 12 * len(kept), len(out))
+    
+    # Place each distinct data block after the IFDs, in file order
+    data_parts = []
+    placed = {}
+    pos = len(out)
+    for index, ifd_blocks in enumerate(blocks):
+        for offsets, counts in ifd_blocks.values():
+            for offset, length in zip(offsets, counts):
+                if (offset, length) in placed:
+                    continue
+                if pos & 1:
+                    data_parts.append(b'\x00')
+                    pos += 1
+                placed[(offset, length)] = pos
+                if length:
+                    data_parts.append((offset, length))
+                pos += length
+    if pos > 0xFFFFFFFF:
+        return None
+    
+    for value_pos, tag, index in patches:
+        offsets, counts = blocks[index][tag]
+        new_offsets = [placed[(offset, length)] for offset, length in zip(offsets, counts)]
+        struct.pack_into(order + 'I' * len(new_offsets), out, value_pos, *new_offsets)
+    
+    return [bytes(out)] + data_parts
+
+
+_WEBP_METADATA_CHUNKS = {b'EXIF', b'XMP ', b'ICCP'}
+_WEBP_METADATA_FLAGS = 0x20 | 0x08 | 0x04  # VP8X flags: ICC profile, EXIF, XMP
+
+
+def _webp_kept_parts(f, size):
+    """
+    Parts of a WebP without its EXIF, XMP and ICC profile chunks: the RIFF
+    header with its new size and the VP8X chunk with those flags cleared
+    as bytes, and the (offset, length) ranges of every other chunk.
+    Returns: list of parts, or None to keep the file as it is
+    """
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[8:12] != b'WEBP':
+        return None
+    riff_end = min(size, 8 + int.from_bytes(header[4:8], 'little'))
+    
+    # (fourcc, offset, length including the pad byte) of each chunk
+    chunks = []
+    pos = 12
+    while pos + 8 <= riff_end:
+        f.seek(pos)
+        chunk_header = f.read(8)
+        chunk_size = int.from_bytes(chunk_header[4:8], 'little')
+        if pos + 8 + chunk_size > riff_end:
+            return None
+        total = min(8 + chunk_size + (chunk_size & 1), riff_end - pos)
+        chunks.append((chunk_header[:4], pos, total))
+        pos += total
+    
+    # Only the extended format (VP8X) can carry metadata
+    if not chunks or chunks[0][0] != b'VP8X' or chunks[0][2] < 9:
+        return None
+    f.seek(chunks[0][1])
+    vp8x = bytearray(f.read(chunks[0][2]))
+    flags = vp8x[8] & ~_WEBP_METADATA_FLAGS
+    kept = [chunk for chunk in chunks[1:] if chunk[0] not in _WEBP_METADATA_CHUNKS]
+    if len(kept) == len(chunks) - 1 and flags == vp8x[8]:
+        return None
+    vp8x[8] = flags
+    
+    body_size = 4 + len(vp8x) + sum(length for _, _, length in kept)
+    parts = [b'RIFF' + body_size.to_bytes(4, 'little') + b'WEBP' + bytes(vp8x)]
+    parts.extend((offset, length) for _, offset, length in kept)
+    return parts
+
+
+# (extensions, signatures, kept-parts parser) of the formats metadata is removed from.
+# A parser returns the parts of the stripped file, or None to keep the file as it is.
+# Other formats (bmp) are left as-is for now
+_METADATA_FORMATS = (
+    (('.jpg', '.jpeg'), (b'\xff\xd8',), _jpeg_kept_ranges),
+    (('.png',), (_PNG_SIGNATURE,), _png_kept_ranges),
+    (('.tif', '.tiff'), (b'II*\x00', b'MM\x00*'), _tiff_kept_parts),
+    (('.webp',), (b'RIFF',), _webp_kept_parts),
+)
+
+
+def _metadata_kept_parts(f, filepath):
+    """
+    Parts of an open image file that metadata removal keeps, in order:
+    (offset, length) byte ranges of the file, with adjacent ranges merged,
+    and bytes objects for rewritten headers (TIFF IFDs, WebP RIFF/VP8X).
+    Formats that aren't stripped (or whose signature doesn't match their
+    extension) are kept whole: [(0, size)].
+    """
+    size = os.fstat(f.fileno()).st_size
+    filepath_lower = filepath.lower()
+    
+    for extensions, signatures, kept_parts in _METADATA_FORMATS:
+        if filepath_lower.endswith(extensions):
+            f.seek(0)
+            head = f.read(max(len(signature) for signature in signatures))
+            if not any(head.startswith(signature) for signature in signatures):
+                break  # Not a valid file of this format
+            
+            try:
+                found = kept_parts(f, size)
+            except (struct.error, IndexError, ValueError):
+                found = None  # Malformed headers: leave the file alone
+            if found is None:
+                break
+            
+            parts = []
+            for part in found:
+                if isinstance(part, bytes):
+                    parts.append(part)
+                elif parts and not isinstance(parts[-1], bytes) and parts[-1][0] + parts[-1][1] == part[0]:
+                    parts[-1] = (parts[-1][0], parts[-1][1] + part[1])
+                elif part[1] > 0:
+                    parts.append(part)
+            return parts
+    
+    return [(0, size)]
+
+
+_KERNEL_COPY_MIN = 1 << 16  # Ranges at least this long are copied inside the kernel when possible
+
+
+def _copy_file_range(src_fd, dst_fd, offset, length):
+    return os.copy_file_range(src_fd, dst_fd, length, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, length):
+    return os.sendfile(dst_fd, src_fd, offset, length)
+
+
+# Kernel-side copies in order of preference (neither exists on Windows)
+_KERNEL_COPIES = [copy for name, copy in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile))
+                  if hasattr(os, name)]
+
+
+def _copy_range(src, dst, offset, length, buffer):
+    """
+    Append length bytes at offset of src to dst (both unbuffered files).
+    Large ranges (the entropy-coded / IDAT bulk) are copied inside the kernel
+    with copy_file_range or sendfile where the OS and file systems support
+    it, so the data never passes through Python; the rest goes through buffer.
+    """
+    if length >= _KERNEL_COPY_MIN:
+        for kernel_copy in _KERNEL_COPIES:
+            try:
+                while length > 0:
+                    n = kernel_copy(src.fileno(), dst.fileno(), offset, length)
+                    if not n:
+                        break
+                    offset += n
+                    length -= n
+            except OSError:
+                continue  # Not supported for these files (e.g. across file systems): try the next way
+            break
+    
+    src.seek(offset)
+    view = memoryview(buffer)
+    while length > 0:
+        n = src.readinto(view[:min(length, len(buffer))])
+        if not n:
+            raise IOError("Unexpected end of file")
+        dst.write(view[:n])
+        length -= n
+
+
+def _write_parts(src_path, parts, dest_path):
+    """
+    Atomically write the given parts of src_path ((offset, length) ranges,
+    or bytes written as they are) to dest_path.
+    The data is written and synced to a temporary file in the destination
+    folder before os.replace() swaps it in, so readers (and a crash) only
+    ever see the old file or the complete new one.
+    """
+    folder = os.path.dirname(dest_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.strip-', suffix='.tmp', dir=folder)
+    try:
+        buffer = bytearray(COPY_BUFFER_SIZE)
+        with os.fdopen(fd, 'wb', buffering=0) as dst, open(src_path, 'rb', buffering=0) as src:
+            for part in parts:
+                if isinstance(part, bytes):
+                    dst.write(part)
+                else:
+                    _copy_range(src, dst, part[0], part[1], buffer)
+            os.fsync(dst.fileno())
+        shutil.copymode(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _rewrite_parts(filepath, parts):
+    """Atomically replace a file with the given parts of it"""
+    _write_parts(filepath, parts, filepath)
+
+
+def content_key(image_path):
+    """
+    Hash of the bytes that remove_metadata_from_file() keeps, so a file keeps
+    its key after it is moved and stripped (and copies with different
+    metadata share one key).
+    Returns: hex digest, or None if the file can't be read
+    """
+    try:
+        digest = hashlib.blake2b(digest_size=16)
+        buffer = bytearray(COPY_BUFFER_SIZE)
+        view = memoryview(buffer)
+        with open(image_path, 'rb') as f:
+            for part in _metadata_kept_parts(f, image_path):
+                if isinstance(part, bytes):
+                    digest.update(part)
+                    continue
+                offset, length = part
+                f.seek(offset)
+                while length > 0:
+                    n = f.readinto(view[:min(length, len(buffer))])
+                    if not n:
+                        break
+                    digest.update(view[:n])
+                    length -= n
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+def move_and_strip(image_path, dest_folder):
+    """
+    Move an image into its category folder with its metadata removed.
+    A name already taken in the category folder gets a _1, _2, ... suffix.
+    
+    The source is read once and only the kept bytes are written, straight
+    to the destination (instead of moving the whole file and then rewriting
+    it there). The source is removed only after the new file is complete.
+    A file with nothing to strip is just renamed when both folders are on
+    the same device.
+    Returns: destination path
+    """
+    with open(image_path, 'rb') as src:
+        size = os.fstat(src.fileno()).st_size
+        parts = _metadata_kept_parts(src, image_path)
+    
+    dest_path = reserve_path(dest_folder, os.path.basename(image_path))
+    try:
+        if parts == [(0, size)]:
+            try:
+                os.replace(image_path, dest_path)
+                return dest_path
+            except OSError:
+                pass  # Different device: copy it like a stripped file
+        _write_parts(image_path, parts, dest_path)
+        os.remove(image_path)
+    except BaseException:
+        if os.path.exists(image_path):
+            os.remove(dest_path)  # Drop the reserved name (or the finished copy)
+        raise
+    return dest_path
+
+
+# ===== Persistent analysis cache =====
+def cache_path_for(folder):
+    """Path of the analysis cache database of a working folder"""
+    return os.path.join(folder, CACHE_FILENAME)
+
+
+class AnalysisCache:
+    """
+    SQLite store of analysis results (pHash, border verdict, dimensions) in
+    the working folder, keyed by content_key().
+    
+    The key ignores the metadata the stripper removes, so results survive
+    files being moved into category folders and stripped. A second table
+    remembers the size and mtime each path had when it was keyed, so an
+    unchanged file is found with a stat() instead of being read again.
+    A third table holds encoded thumbnails per content key and size, so a
+    gallery reopens without decoding the originals.
+    """
+    
+    COMMIT_EVERY = 500  # Pending writes before an automatic commit
+    SCHEMA_VERSION = 2  # Version 1 stored pHashes of PNG/TIFF taken from non-BT.601 grayscale decodes
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock:
+            # WAL lets worker processes read while the parent writes
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis ("
+                "content_key TEXT PRIMARY KEY, phash TEXT, border TEXT, width INTEGER, height INTEGER)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, content_key TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "content_key TEXT, width INTEGER, height INTEGER, data BLOB, PRIMARY KEY (content_key, width, height))"
+            )
+            # Analyses from an older version are recomputed (paths and thumbnails stay valid)
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                self.conn.execute("DELETE FROM analysis")
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.conn.commit()
+    
+    @staticmethod
+    def path_key(path):
+        return os.path.normcase(os.path.abspath(path))
+    
+    def known_files(self):
+        """Return {path key: (size, mtime_ns, phash)} of every keyed file, for checking a whole folder at once"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT f.path, f.size, f.mtime_ns, a.phash "
+                "FROM files f JOIN analysis a ON a.content_key = f.content_key"
+            ).fetchall()
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+    
+    def lookup_key(self, key):
+        """Return the stored analysis for a content key, or None"""
+        if not key:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT phash, border, width, height FROM analysis WHERE content_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'content_key': key, 'phash': row[0], 'border': row[1], 'width': row[2], 'height': row[3]}
+    
+    def lookup_path(self, path):
+        """Return the stored analysis of a file if it is unchanged since it was keyed, or None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT f.size, f.mtime_ns, a.content_key, a.phash, a.border, a.width, a.height "
+                "FROM files f JOIN analysis a ON a.content_key = f.content_key WHERE f.path = ?",
+                (self.path_key(path),)
+            ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return {'content_key': row[2], 'phash': row[3], 'border': row[4], 'width': row[5], 'height': row[6]}
+    
+    def path_content_key(self, path):
+        """Return the content key of a file if it is unchanged since it was keyed (analysed or not), or None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, content_key FROM files WHERE path = ?", (self.path_key(path),)
+            ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return row[2]
+    
+    def lookup_thumbnail(self, key, size):
+        """Return the stored JPEG bytes of the thumbnail fitted to size (width, height), or None"""
+        if not key:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM thumbnails WHERE content_key = ? AND width = ? AND height = ?", (key, size[0], size[1])
+            ).fetchone()
+        return row[0] if row else None
+    
+    def store_thumbnail(self, key, size, data):
+        """Store JPEG thumbnail bytes for a content key and size (width, height)"""
+        if not key or not data:
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (content_key, width, height, data) VALUES (?, ?, ?, ?)",
+                (key, size[0], size[1], sqlite3.Binary(data))
+            )
+            self._count_write()
+    
+    def store(self, path, analysis):
+        """Store an analysis (dict with content_key, phash, border, width, height) and key its path"""
+        key = analysis.get('content_key')
+        if not key or not analysis.get('phash'):
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analysis (content_key, phash, border, width, height) VALUES (?, ?, ?, ?, ?)",
+                (key, analysis['phash'], analysis.get('border'), analysis.get('width'), analysis.get('height'))
+            )
+            self._record_path(path, key)
+    
+    def record_path(self, path, key, old_path=None):
+        """Key a file at its (new) path, e.g. after it was moved and stripped"""
+        if not key:
+            return
+        with self.lock:
+            if old_path:
+                self.conn.execute("DELETE FROM files WHERE path = ?", (self.path_key(old_path),))
+            self._record_path(path, key)
+    
+    def _record_path(self, path, key):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_key) VALUES (?, ?, ?, ?)",
+            (self.path_key(path), st.st_size, st.st_mtime_ns, key)
+        )
+        self._count_write()
+    
+    def _count_write(self):
+        self.pending += 1
+        if self.pending >= self.COMMIT_EVERY:
+            self.conn.commit()
+            self.pending = 0
+    
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending = 0
+    
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+_worker_caches = {}
+
+
+def open_worker_cache(cache_path):
+    """Per-process AnalysisCache connection, opened on first use"""
+    cache = _worker_caches.get(cache_path)
+    if cache is None:
+        cache = _worker_caches[cache_path] = AnalysisCache(cache_path)
+    return cache
+
+
+def result_from_analysis(image_path, position, analysis, cached='key'):
+    """Build a check_image_standalone() style result from a stored analysis, without decoding"""
+    border = analysis.get('border')
+    return {
+        'filename': os.path.basename(image_path),
+        'path': image_path,
+        'position': position,
+        'is_good': not border,
+        'category': border or 'good',
+        'error': False,
+        'phash': analysis['phash'],
+        'preview': None,
+        'content_key': analysis['content_key'],
+        'border': border,
+        'width': analysis.get('width'),
+        'height': analysis.get('height'),
+        'cached': cached,
+        'border_stats': None
+    }
+
+
+def cached_future(cache, image_path, position):
+    """
+    Return an already completed future holding the cached result of an
+    unchanged file, or None if it has to be analysed by a worker.
+    """
+    if cache is None:
+        return None
+    analysis = cache.lookup_path(image_path)
+    if analysis is None:
+        return None
+    future = Future()
+    future.set_result(result_from_analysis(image_path, position, analysis, cached='path'))
+    return future
+
+
+# ===== Thumbnails =====
+class ThumbnailLRU:
+    """
+    Memory-bounded cache of decoded thumbnails (ImageTk.PhotoImage) keyed by
+    (path, width, height). The least recently used ones are dropped once the
+    images would take more than max_bytes.
+    """
+    
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.items = OrderedDict()  # key -> (image, bytes)
+        self.bytes = 0
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def get(self, key):
+        """Return the cached image and mark it as recently used, or None"""
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            self.items.move_to_end(key)
+            return item[0]
+    
+    def put(self, key, image):
+        """Cache an image under (path, width, height), dropping the least recently used ones over the limit"""
+        nbytes = key[1] * key[2] * 4  # Tk keeps 32 bits per pixel
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.items[key] = (image, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes and len(self.items) > 1:
+                _, (_, dropped) = self.items.popitem(last=False)
+                self.bytes -= dropped
+    
+    def discard_path(self, path):
+        """Forget every size cached for a file (e.g. after it was deleted)"""
+        with self.lock:
+            for key in [key for key in self.items if key[0] == path]:
+                self.bytes -= self.items.pop(key)[1]
+    
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.bytes = 0
+
+
+def load_thumbnail(image_path, size, cache=None):
+    """
+    Thumbnail of an image fitted to size (width, height), as BGR.
+    With an AnalysisCache it is read from the thumbnail store when the file's
+    content is known there; otherwise the original is decoded once and the
+    thumbnail is added to the store for the next time.
+    Returns: BGR image or None
+    """
+    key = None
+    if cache:
+        key = cache.path_content_key(image_path)
+        if key is None:
+            key = content_key(image_path)
+            cache.record_path(image_path, key)
+        thumb = decode_preview(cache.lookup_thumbnail(key, size))
+        if thumb is not None:
+            return thumb
+    
+    img = imread_unicode(image_path)
+    if img is None:
+        return None
+    thumb = fit_image(img, size[0], size[1])
+    if cache:
+        cache.store_thumbnail(key, size, encode_preview(thumb, size))
+    return thumb
+
+
+# ===== Virtualized thumbnail grid =====
+class VirtualThumbnailGrid:
+    """
+    Gallery grid drawn on a Canvas that only has widgets for the rows in view
+    (plus GALLERY_MARGIN_ROWS above and below). Cells are recycled while
+    scrolling, so a folder of any size costs a few dozen widgets.
+    Thumbnails are loaded in background threads, newest request first, and
+    requests for cells that scrolled away are dropped.
+    
+    The content is a list of sections (title or None, [paths]); each section
+    starts on a new row under its title.
+    Callbacks (all called on the Tk thread except load):
+        load(path, size)       -> RGB thumbnail or None (loader threads)
+        describe(path)         -> (name text, info text, highlight)
+        is_selected(path)      -> bool
+        on_toggle(path, checked)
+        on_click(path, section paths)
+        on_idle()              -> the load queue ran empty (optional)
+    """
+    CELL_WIDTH = 130
+    CELL_HEIGHT = 150
+    HEADER_HEIGHT = 40
+    PADDING = 10
+    
+    def __init__(self, canvas, scrollbar, cache, load, describe, is_selected,
+                 on_toggle, on_click, on_idle=None):
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.cache = cache  # ThumbnailLRU of PhotoImages
+        self.load = load
+        self.describe = describe
+        self.is_selected = is_selected
+        self.on_toggle = on_toggle
+        self.on_click = on_click
+        self.on_idle = on_idle
+        
+        self.sections = []
+        self.size = GALLERY_THUMBNAIL_SIZE
+        self.columns = 1
+        self.width = 0
+        self.rows = []       # (top, 'header', title) or (top, 'cells', (section, first index))
+        self.row_tops = []
+        self.cells = {}      # (section, index) -> bound cell
+        self.headers = {}    # row index -> canvas item ids
+        self.pool = []       # unbound cells
+        self.failed = set()  # paths whose thumbnail could not be made
+        self.render_pending = False
+        
+        # Load queue shared with the loader threads
+        self.cond = threading.Condition()
+        self.requests = []   # stack: the most recent request is loaded first
+        self.wanted = set()  # paths of the bound cells
+        self.queued = set()
+        self.generation = 0
+        for _ in range(GALLERY_LOADERS):
+            threading.Thread(target=self._load_worker, daemon=True).start()
+        
+        canvas.configure(yscrollcommand=self._on_scroll)
+        canvas.bind("<Configure>", self._on_configure)
+        self._bind_wheel(canvas)
+    
+    # ----- Content -----
+    
+    def show(self, sections, size):
+        """Replace the content with sections of (title or None, [paths])"""
+        self.clear()
+        self.sections = [(title, list(paths)) for title, paths in sections]
+        self.size = size
+        self._layout()
+    
+    def clear(self):
+        """Remove all content and drop pending thumbnail loads"""
+        for key in list(self.cells):
+            self._release(key)
+        for row in list(self.headers):
+            self._drop_header(row)
+        with self.cond:
+            self.generation += 1
+            self.requests = []
+            self.queued.clear()
+            self.wanted.clear()
+        self.sections = []
+        self.rows = []
+        self.row_tops = []
+        self.failed.clear()
+        self.canvas.configure(scrollregion=(0, 0, 0, 0))
+        self.canvas.yview_moveto(0)
+    
+    def refresh_checks(self):
+        """Re-read the selection state of the visible cells (after mark/unmark all)"""
+        for cell in self.cells.values():
+            cell['var'].set(bool(self.is_selected(cell['path'])))
+    
+    # ----- Layout and rendering -----
+    
+    def _layout(self):
+        """Compute row positions for the current width and redraw the visible rows"""
+        self.width = max(self.canvas.winfo_width(), self.CELL_WIDTH + 2 * self.PADDING)
+        self.columns = max(1, (self.width - 2 * self.PADDING) // self.CELL_WIDTH)
+        
+        rows = []
+        top = self.PADDING
+        for section_index, (title, paths) in enumerate(self.sections):
+            if title:
+                rows.append((top, 'header', title))
+                top += self.HEADER_HEIGHT
+            for first in range(0, len(paths), self.columns):
+                rows.append((top, 'cells', (section_index, first)))
+                top += self.CELL_HEIGHT
+        
+        # Cells sit in different rows now, so rebind everything
+        for key in list(self.cells):
+            self._release(key)
+        for row in list(self.headers):
+            self._drop_header(row)
+        
+        self.rows = rows
+        self.row_tops = [row[0] for row in rows]
+        self.canvas.configure(scrollregion=(0, 0, self.width, top + self.PADDING))
+        self._render()
+    
+    def _visible_rows(self):
+        """Index range of the rows in the viewport plus the margin"""
+        if not self.rows:
+            return 0, 0
+        top = self.canvas.canvasy(0)
+        bottom = top + max(self.canvas.winfo_height(), 1)
+        first = max(0, bisect_right(self.row_tops, top) - 1 - GALLERY_MARGIN_ROWS)
+        last = min(len(self.rows), bisect_left(self.row_tops, bottom) + GALLERY_MARGIN_ROWS)
+        return first, last
+    
+    def _render(self):
+        """Bind cells and headers to the visible rows and release the rest"""
+        self.render_pending = False
+        first, last = self._visible_rows()
+        
+        wanted_cells = {}
+        wanted_headers = set()
+        for row_index in range(first, last):
+            top, kind, payload = self.rows[row_index]
+            if kind == 'header':
+                wanted_headers.add(row_index)
+                continue
+            section_index, start = payload
+            paths = self.sections[section_index][1]
+            for col, index in enumerate(range(start, min(start + self.columns, len(paths)))):
+                x = self.PADDING + col * self.CELL_WIDTH
+                wanted_cells[(section_index, index)] = (x, top)
+        
+        for key in [key for key in self.cells if key not in wanted_cells]:
+            self._release(key)
+        for row in [row for row in self.headers if row not in wanted_headers]:
+            self._drop_header(row)
+        
+        for row in wanted_headers:
+            if row not in self.headers:
+                self._draw_header(row)
+        # Bind in reading order so the top of the viewport is requested last (= loaded first)
+        new_keys = sorted(key for key in wanted_cells if key not in self.cells)
+        for key in reversed(new_keys):
+            self._bind(key, *wanted_cells[key])
+    
+    def _schedule_render(self):
+        if not self.render_pending:
+            self.render_pending = True
+            self.canvas.after_idle(self._render)
+    
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_render()
+    
+    def _on_configure(self, event):
+        if event.width != self.width and self.sections:
+            self._layout()
+        else:
+            self._schedule_render()
+    
+    def _on_wheel(self, event):
+        if getattr(event, 'num', None) == 4:
+            step = -1
+        elif getattr(event, 'num', None) == 5:
+            step = 1
+        else:
+            step = int(-1 * (event.delta / 120))
+        self.canvas.yview_scroll(step, "units")
+    
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_wheel)
+        widget.bind("<Button-4>", self._on_wheel)
+        widget.bind("<Button-5>", self._on_wheel)
+    
+    # ----- Headers -----
+    
+    def _draw_header(self, row):
+        top, _, title = self.rows[row]
+        text = self.canvas.create_text(
+            self.PADDING, top + 12, text=title, anchor="w",
+            font=("TkDefaultFont", 12, "bold"), fill="#4dabf7"
+        )
+        line = self.canvas.create_line(
+            self.PADDING, top + 30, self.width - self.PADDING, top + 30, fill="#444444"
+        )
+        self.headers[row] = (text, line)
+    
+    def _drop_header(self, row):
+        for item in self.headers.pop(row):
+            self.canvas.delete(item)
+    
+    # ----- Cells -----
+    
+    def _new_cell(self):
+        """Build one reusable cell: checkbox, thumbnail, name and info labels"""
+        frame = ttk.Frame(self.canvas)
+        cell = {'frame': frame, 'var': tk.BooleanVar(value=False), 'path': None, 'section': None}
+        
+        ttk.Checkbutton(
+            frame,
+            variable=cell['var'],
+            command=lambda c=cell: self.on_toggle(c['path'], c['var'].get()),
+            bootstyle="primary-round-toggle"
+        ).pack(anchor=NE)
+        
+        cell['thumb'] = ttk.Label(frame, text="⏳", width=12, anchor=CENTER, cursor="hand2")
+        cell['thumb'].pack()
+        cell['thumb'].bind("<Button-1>", lambda e, c=cell: self.on_click(c['path'], c['section']))
+        
+        cell['name'] = ttk.Label(frame, font=("TkDefaultFont", 8))
+        cell['name'].pack()
+        cell['info'] = ttk.Label(frame, font=("TkDefaultFont", 8), foreground="#888888")
+        cell['info'].pack()
+        
+        for widget in [frame] + frame.winfo_children():
+            self._bind_wheel(widget)
+        
+        cell['item'] = self.canvas.create_window(0, 0, window=frame, anchor="nw")
+        return cell
+    
+    def _bind(self, key, x, y):
+        """Show the image at key in a pooled cell placed at (x, y)"""
+        cell = self.pool.pop() if self.pool else self._new_cell()
+        section = self.sections[key[0]][1]
+        path = section[key[1]]
+        cell['path'] = path
+        cell['section'] = section
+        cell['var'].set(bool(self.is_selected(path)))
+        
+        name, info, highlight = self.describe(path)
+        cell['name'].config(text=name, foreground="#ff6b6b" if highlight else "")
+        cell['info'].config(text=info)
+        
+        photo = self.cache.get((path,) + tuple(self.size))
+        if photo is not None:
+            cell['thumb'].config(image=photo, text="")
+            cell['thumb'].image_tk = photo
+        else:
+            cell['thumb'].config(image="", text="❌" if path in self.failed else "⏳")
+            cell['thumb'].image_tk = None
+            if path not in self.failed:
+                self._request(path)
+        
+        self.canvas.coords(cell['item'], x, y)
+        self.canvas.itemconfigure(cell['item'], state="normal")
+        self.cells[key] = cell
+        with self.cond:
+            self.wanted.add(path)
+    
+    def _release(self, key):
+        """Hide a cell and return it to the pool"""
+        cell = self.cells.pop(key)
+        self.canvas.itemconfigure(cell['item'], state="hidden")
+        with self.cond:
+            self.wanted.discard(cell['path'])
+        cell['path'] = None
+        cell['section'] = None
+        cell['thumb'].config(image="")
+        cell['thumb'].image_tk = None
+        self.pool.append(cell)
+    
+    # ----- Thumbnail loading -----
+    
+    def _request(self, path):
+        with self.cond:
+            if path in self.queued:
+                # Already waiting: move it to the top of the stack
+                self.requests.remove(path)
+            self.queued.add(path)
+            self.requests.append(path)
+            self.cond.notify()
+    
+    def _load_worker(self):
+        while True:
+            with self.cond:
+                while not self.requests:
+                    self.cond.wait()
+                path = self.requests.pop()
+                self.queued.discard(path)
+                generation = self.generation
+                size = self.size
+                if path not in self.wanted:
+                    # Scrolled away before its turn
+                    continue
+            
+            try:
+                thumb = self.load(path, size)
+            except Exception as e:
+                print(f"Error loading thumbnail {path}: {e}")
+                thumb = None
+            
+            with self.cond:
+                idle = not self.requests
+            try:
+                self.canvas.after(0, lambda p=path, t=thumb, g=generation: self._apply(p, t, g))
+                if idle and self.on_idle:
+                    self.canvas.after(0, self.on_idle)
+            except (RuntimeError, tk.TclError):
+                return  # The window is gone
+    
+    def _apply(self, path, thumb, generation):
+        """Put a loaded thumbnail into the cells showing it (Tk thread)"""
+        if generation != self.generation:
+            return
+        if thumb is None:
+            self.failed.add(path)
+            photo = None
+        else:
+            photo = ImageTk.PhotoImage(Image.fromarray(thumb))
+            self.cache.put((path,) + tuple(self.size), photo)
+        
+        for cell in self.cells.values():
+            if cell['path'] == path:
+                if photo is None:
+                    cell['thumb'].config(text="❌")
+                else:
+                    cell['thumb'].config(image=photo, text="")
+                    cell['thumb'].image_tk = photo
+
+
+# ===== Stage timing =====
+RATE_WINDOW_SECONDS = 15  # Live images/s (and the ETA) are measured over this trailing window
+RUN_SUMMARY_PREFIX = 'borderdetect_run_'
+
+
+class StageTimer:
+    """
+    Thread-safe latency statistics per pipeline stage (decode, phash, border,
+    move_strip, preview, ...). Durations are counted in log-spaced buckets
+    about 5% wide, so percentiles over any number of images use constant memory.
+    """
+    BUCKETS_PER_DOUBLING = 14
+    MIN_SECONDS = 1e-6
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> [count, total seconds, max seconds, {bucket: count}]
+    
+    def add(self, stage, seconds):
+        """Record one duration of a stage"""
+        bucket = int(math.log2(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_DOUBLING) if seconds > self.MIN_SECONDS else 0
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = [0, 0.0, 0.0, {}]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3][bucket] = entry[3].get(bucket, 0) + 1
+    
+    def add_all(self, timings):
+        """Record a {stage: seconds} dict, e.g. result['timings'] from a worker"""
+        for stage, seconds in (timings or {}).items():
+            self.add(stage, seconds)
+    
+    def busiest(self):
+        """Name of the stage with the most total time so far, or None"""
+        with self.lock:
+            if not self.stages:
+                return None
+            return max(self.stages, key=lambda stage: self.stages[stage][1])
+    
+    def summary(self):
+        """Returns: {stage: {count, total_seconds, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}}"""
+        with self.lock:
+            stages = {stage: (count, total, peak, dict(buckets)) for stage, (count, total, peak, buckets) in self.stages.items()}
+        
+        summary = {}
+        for stage, (count, total, peak, buckets) in stages.items():
+            summary[stage] = {
+                'count': count,
+                'total_seconds': round(total, 3),
+                'mean_ms': round(total / count * 1000, 3),
+                'p50_ms': round(self._percentile(buckets, count, peak, 0.50) * 1000, 3),
+                'p90_ms': round(self._percentile(buckets, count, peak, 0.90) * 1000, 3),
+                'p99_ms': round(self._percentile(buckets, count, peak, 0.99) * 1000, 3),
+                'max_ms': round(peak * 1000, 3)
+            }
+        return summary
+    
+    def _percentile(self, buckets, count, peak, fraction):
+        rank = fraction * count
+        seen = 0
+        for bucket in sorted(buckets):
+            seen += buckets[bucket]
+            if seen >= rank:
+                # Geometric middle of the bucket, never above the largest value seen
+                return min(peak, self.MIN_SECONDS * 2 ** ((bucket + 0.5) / self.BUCKETS_PER_DOUBLING))
+        return peak
+
+
+class RateMeter:
+    """Images per second over a trailing window, for the live rate and ETA"""
+    
+    def __init__(self, window=RATE_WINDOW_SECONDS):
+        self.window = window
+        self.samples = []  # (time, processed count)
+    
+    def update(self, processed, now=None):
+        """Add a sample of the processed count. Returns: images per second, or None until there are two samples"""
+        now = time.time() if now is None else now
+        self.samples.append((now, processed))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.pop(0)
+        start_time, start_count = self.samples[0]
+        if now <= start_time:
+            return None
+        return (processed - start_count) / (now - start_time)
+    
+    def eta(self, processed, total, rate):
+        """Seconds left at the given rate, or None if it can't be estimated"""
+        if not rate or total <= processed:
+            return None
+        return (total - processed) / rate
+
+
+def build_run_summary(folder, started, elapsed, processed, total, categories, workers, stage_timer, **extra):
+    """Collect the numbers of a finished run into a JSON-serializable dict"""
+    summary = {
+        'folder': os.path.abspath(folder),
+        'started': datetime.datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+        'elapsed_seconds': round(elapsed, 3),
+        'images': processed,
+        'total': total,
+        'images_per_second': round(processed / elapsed, 2) if elapsed else 0.0,
+        'workers': workers,
+        'categories': dict(categories),
+        'stages': stage_timer.summary()
+    }
+    summary.update(extra)
+    return summary
+
+
+def write_run_summary(folder, summary):
+    """
+    Write a run summary as JSON next to the category folders.
+    Returns: path of the written file, or None on error
+    """
+    path = os.path.join(folder, f"{RUN_SUMMARY_PREFIX}{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    except OSError as e:
+        print(f"Error writing run summary: {e}")
+        return None
+    return path
+
+
+def format_stage_table(stages):
+    """Lines of a per-stage latency table for console output"""
+    lines = [f"  {'stage':<16}{'count':>9}{'total s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"]
+    for stage, s in sorted(stages.items(), key=lambda item: -item[1]['total_seconds']):
+        lines.append(f"  {stage:<16}{s['count']:>9}{s['total_seconds']:>10.1f}{s['p50_ms']:>10.2f}{s['p90_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+    return lines
+
+
+# ===== Pipelined submission =====
+def run_pipelined(image_queue, submit, handle, window, should_continue=None, producer_done=None):
+    """
+    Keep up to `window` tasks from image_queue in flight and handle each
+    result as soon as it completes, instead of blocking on one at a time.
+    
+    Args:
+        image_queue: queue of image paths
+        submit: function(image_path) -> (future, context)
+        handle: function(image_path, result, context), called in completion order
+        window: maximum number of tasks in flight
+        should_continue: optional function; when it returns False no new tasks
+            are submitted, but the ones in flight are still handled
+        producer_done: optional threading.Event of a producer still filling
+            image_queue; an empty queue only ends the run once it is set
+    """
+    pending = {}
+    while True:
+        while len(pending) < window and (should_continue is None or should_continue()):
+            # With nothing in flight, wait for the producer instead of finishing
+            block = not pending and producer_done is not None and not producer_done.is_set()
+            try:
+                image_path = image_queue.get(block=block, timeout=0.1 if block else None)
+            except queue.Empty:
+                if block:
+                    continue
+                break
+            try:
+                future, context = submit(image_path)
+            except Exception as e:
+                print(f"Error submitting {image_path}: {e}")
+                image_queue.task_done()
+                continue
+            pending[future] = (image_path, context)
+        
+        if not pending:
+            break
+        
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            image_path, context = pending.pop(future)
+            try:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'error': True, 'path': image_path, 'exception': str(e)}
+                handle(image_path, result, context)
+            except Exception as e:
+                print(f"Error processing image: {e}")
+            finally:
+                image_queue.task_done()
+
+
+# ===== Incremental library =====
+def seed_library(folder, category_names, hash_index, cache, executor, window):
+    """
+    Add the images already sorted into the category folders to hash_index,
+    so new files are checked for duplicates against the whole library.
+    
+    Files the cache knows unchanged only cost a stat; unknown or modified
+    ones are analysed by the workers where they are (they are not moved).
+    Returns: number of library images in the index
+    """
+    known = cache.known_files() if cache else {}
+    stale = queue.Queue()
+    
+    for category_name in category_names:
+        category_folder = os.path.join(folder, category_name)
+        if not os.path.isdir(category_folder):
+            continue
+        for entry in scan_images(category_folder):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            
+            record = known.get(AnalysisCache.path_key(entry.path))
+            if record is not None and record[0] == st.st_size and record[1] == st.st_mtime_ns:
+                hash_index.add(entry.path, record[2])
+            else:
+                stale.put(entry.path)
+    
+    if not stale.empty():
+        def submit(image_path):
+            future = executor.submit(check_image_standalone, image_path, 0, None, cache.path if cache else None)
+            return future, None
+        
+        def handle(image_path, result, context):
+            if result.get('error') or not result.get('phash'):
+                return
+            hash_index.add(image_path, result['phash'])
+            if cache:
+                cache.store(image_path, result)
+        
+        run_pipelined(stale, submit, handle, window)
+        if cache:
+            cache.commit()
+    
+    return len(hash_index)
+
+
+# ===== File operation stage =====
+class FileOpStage:
+    """
+    Runs file operations (move into the category folder + metadata removal)
+    on a pool of threads, separate from the decoding process pool.
+    
+    The queue in front of it is bounded: when the threads fall behind,
+    submit() blocks, which holds back the scanner instead of letting
+    classified results pile up in memory.
+    """
+    
+    def __init__(self, handle, workers=FILE_WORKERS, max_queue=FILE_QUEUE_SIZE):
+        self.handle = handle
+        self.queue = queue.Queue(maxsize=max(1, max_queue))
+        self.threads = [
+            threading.Thread(target=self._run, daemon=True)
+            for _ in range(max(1, workers))
+        ]
+        for t in self.threads:
+            t.start()
+    
+    def submit(self, item):
+        """Queue an item for handle(item); blocks while the queue is full"""
+        self.queue.put(item)
+    
+    def depth(self):
+        """Number of items waiting for a thread"""
+        return self.queue.qsize()
+    
+    def join(self):
+        """Wait until every submitted item has been handled"""
+        self.queue.join()
+    
+    def close(self):
+        """Handle what is queued, then stop the threads"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.handle(item)
+            except Exception as e:
+                print(f"Error in file operation: {e}")
+            finally:
+                self.queue.task_done()
+
+
+# ===== Plan manifest =====
+PLAN_VERSION = 1
+
+
+def plan_relpath(path, folder):
+    """Path relative to the scanned folder with forward slashes, so a manifest can be applied on another OS or mount"""
+    return os.path.relpath(path, folder).replace(os.sep, '/')
+
+
+def plan_entry(result, folder):
+    """
+    Build the manifest record for a worker result.
+    The file's size and mtime are recorded so that applying the plan can
+    skip images that changed after they were classified.
+    """
+    path = result['path']
+    entry = {'type': 'error' if result.get('error') else 'image', 'path': plan_relpath(path, folder)}
+    try:
+        st = os.stat(path)
+        entry['size'] = st.st_size
+        entry['mtime_ns'] = st.st_mtime_ns
+    except OSError:
+        pass
+    
+    if result.get('error'):
+        entry['error'] = result.get('exception')
+        return entry
+    
+    duplicate_of = result.get('duplicate_of')
+    entry.update({
+        'category': result['category'],
+        'border': result.get('border'),
+        'duplicate_of': plan_relpath(duplicate_of, folder) if duplicate_of else None,
+        'phash': result.get('phash'),
+        'content_key': result.get('content_key'),
+        'width': result.get('width'),
+        'height': result.get('height'),
+        'border_stats': result.get('border_stats')
+    })
+    return entry
+
+
+def read_plan_header(f):
+    """Read and check the first line of a plan manifest. Returns: header dict"""
+    try:
+        header = json.loads(f.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('type') != 'plan':
+        raise ValueError(f"Not a plan manifest: {f.name}")
+    if header.get('version') != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan manifest version: {header.get('version')}")
+    return header
+
+
+def read_plan(manifest_path):
+    """
+    Read a manifest written in plan mode.
+    Returns: tuple (header dict, list of image entries); error records are left out
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        header = read_plan_header(f)
+        entries = []
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('type') == 'image':
+                entries.append(record)
+    return header, entries
+
+
+# ===== Headless batch engine =====
+class ScanEngine:
+    """
+    Runs the same pipeline as the GUI (classify -> move -> strip metadata)
+    without Tk, so it can be scheduled on machines with no display.
+    
+    With plan_path the folder is only classified: every verdict is streamed
+    to that JSONL manifest and no file is moved, stripped or created in the
+    folder. apply_plan() later executes such a manifest.
+    """
+    
+    def __init__(self, folder, workers=None, in_flight_per_worker=IN_FLIGHT_PER_WORKER, progress_every=500, use_cache=True, incremental=False, recursive=False,
+                 file_workers=FILE_WORKERS, file_queue_size=FILE_QUEUE_SIZE, plan_path=None, thumbnails=False):
+        self.folder = folder
+        self.num_cores = workers or max(1, multiprocessing.cpu_count() - 1)
+        self.in_flight_per_worker = max(1, in_flight_per_worker)
+        self.progress_every = progress_every
+        self.use_cache = use_cache
+        self.incremental = incremental
+        self.recursive = recursive
+        self.file_workers = max(1, file_workers)
+        self.file_queue_size = max(1, file_queue_size)
+        self.plan_path = plan_path
+        self.thumbnails = thumbnails  # Store gallery thumbnails in the analysis cache while scanning
+        self.plan_file = None
+        self.file_stage = None
+        self.analysis_cache = None
+        
+        self.categories = {
+            'good': 'Good',
+            'black': 'Black',
+            'white': 'White',
+            'duplicate': 'Duplicate'
+        }
+        
+        self.work_queue = queue.Queue()
+        self.scan_done = threading.Event()
+        self.hash_index = HashIndex()
+        self.progress_lock = threading.Lock()
+        self.stage_timer = StageTimer()
+        
+        self.total_images = 0
+        self.processed_images = 0
+        self.cached_images = 0
+        self.library_images = 0
+        self.skipped_images = 0
+        self.errors = 0
+        self.category_counts = {name: 0 for name in self.categories.values()}
+        self.start_time = None
+        self.elapsed = 0.0
+    
+    def prepare_folder(self):
+        """Create the category folders and open the analysis cache (plan mode leaves the folder untouched)"""
+        if self.plan_path:
+            return
+        for category in self.categories.values():
+            os.makedirs(os.path.join(self.folder, category), exist_ok=True)
+        if self.use_cache and self.analysis_cache is None:
+            self.analysis_cache = AnalysisCache(cache_path_for(self.folder))
+    
+    def collect_images(self):
+        """Queue every image file in the folder before running, and return the count"""
+        self.prepare_folder()
+        self.enqueue_images()
+        return self.total_images
+    
+    def enqueue_images(self):
+        """Feed the folder's images into the work queue while the folder is being read"""
+        try:
+            for entry in scan_images(self.folder, self.recursive, skip_dirs=self.categories.values()):
+                self.work_queue.put(entry.path)
+                with self.progress_lock:
+                    self.total_images += 1
+        finally:
+            self.scan_done.set()
+    
+    def run(self):
+        """Process the whole folder using every worker process, then return the stats"""
+        self.prepare_folder()
+        
+        self.start_time = time.time()
+        if not self.scan_done.is_set():
+            # Workers start on the first images while the rest of the folder is still being read
+            threading.Thread(target=self.enqueue_images, daemon=True).start()
+        
+        if self.plan_path:
+            self.plan_file = open(self.plan_path, 'w', encoding='utf-8')
+            self.plan_file.write(json.dumps({
+                'type': 'plan',
+                'version': PLAN_VERSION,
+                'folder': os.path.abspath(self.folder),
+                'created': datetime.datetime.now().isoformat(timespec='seconds')
+            }, ensure_ascii=False) + '\n')
+        else:
+            self.file_stage = FileOpStage(self._handle_result, self.file_workers, self.file_queue_size)
+        try:
+            with ProcessPoolExecutor(max_workers=self.num_cores) as executor:
+                # Incremental: new files are checked against everything already sorted
+                if self.incremental:
+                    self.library_images = seed_library(
+                        self.folder, self.categories.values(), self.hash_index, self.analysis_cache,
+                        executor, self.num_cores * self.in_flight_per_worker
+                    )
+                
+                # One feeder thread per worker process, each with its own in-flight window
+                threads = [
+                    threading.Thread(target=self._feed_worker, args=(executor, i), daemon=True)
+                    for i in range(self.num_cores)
+                ]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+        finally:
+            if self.file_stage:
+                self.file_stage.close()
+            if self.plan_file:
+                self.plan_file.close()
+                self.plan_file = None
+        self.elapsed = time.time() - self.start_time
+        if self.analysis_cache:
+            self.analysis_cache.commit()
+        
+        return self.stats()
+    
+    def _feed_worker(self, executor, position):
+        """Keep this worker's window of tasks in flight and handle results as they complete"""
+        cache = self.analysis_cache
+        
+        def submit(image_path):
+            future = cached_future(cache, image_path, position)
+            if future is None:
+                future = executor.submit(
+                    check_image_standalone,
+                    image_path,
+                    position,
+                    None,
+                    cache.path if cache else None,
+                    SCAN_THUMBNAIL_SIZES if cache and self.thumbnails else None,
+                    self.plan_file is not None
+                )
+            return future, None
+        
+        def handle(image_path, result, context):
+            if result.get('error'):
+                with self.progress_lock:
+                    self.errors += 1
+                if self.plan_file:
+                    self._write_plan(result)
+                return
+            timer = self.stage_timer
+            timer.add_all(result.get('timings'))
+            
+            started = time.perf_counter()
+            self.hash_index.commit(result)
+            if cache and result.get('cached') != 'path':
+                cache.store(image_path, result)
+                # Thumbnails made by the worker: the gallery will not decode this image again
+                for size, data in (result.pop('thumbnails', None) or {}).items():
+                    cache.store_thumbnail(result['content_key'], size, data)
+            timer.add('index', time.perf_counter() - started)
+            
+            started = time.perf_counter()
+            if self.plan_file:
+                self._write_plan(result)
+                timer.add('plan_write', time.perf_counter() - started)
+            else:
+                self.file_stage.submit(result)
+                timer.add('move_queue_wait', time.perf_counter() - started)
+        
+        run_pipelined(self.work_queue, submit, handle, self.in_flight_per_worker, producer_done=self.scan_done)
+    
+    def _handle_result(self, result):
+        """Move the image to its category folder and strip its metadata (runs on a file stage thread)"""
+        category_name = self.categories[result['category']]
+        try:
+            started = time.perf_counter()
+            dest_path = move_and_strip(result['path'], os.path.join(self.folder, category_name))
+            self.stage_timer.add('move_strip', time.perf_counter() - started)
+            if self.analysis_cache:
+                self.analysis_cache.record_path(dest_path, result.get('content_key'), old_path=result['path'])
+        except Exception as e:
+            print(f"Error moving file: {e}")
+            with self.progress_lock:
+                self.errors += 1
+            return
+        
+        with self.progress_lock:
+            self.category_counts[category_name] += 1
+            self.processed_images += 1
+            if result.get('cached'):
+                self.cached_images += 1
+            processed = self.processed_images
+        
+        self._report_progress(processed)
+    
+    def _write_plan(self, result):
+        """Append a result to the plan manifest instead of moving the file (runs on a feeder thread)"""
+        line = json.dumps(plan_entry(result, self.folder), ensure_ascii=False) + '\n'
+        with self.progress_lock:
+            self.plan_file.write(line)
+            if result.get('error'):
+                return
+            self.category_counts[self.categories[result['category']]] += 1
+            self.processed_images += 1
+            if result.get('cached'):
+                self.cached_images += 1
+            processed = self.processed_images
+        
+        self._report_progress(processed)
+    
+    def _report_progress(self, processed):
+        if self.progress_every and processed % self.progress_every == 0:
+            elapsed = time.time() - self.start_time
+            pending = f", {self.file_stage.depth()} to move" if self.file_stage else ""
+            print(f"Processed {processed} of {self.total_images} images ({processed / max(elapsed, 1e-9):.1f} images/s, "
+                  f"queued: {self.work_queue.qsize()} to check{pending})")
+    
+    def apply_plan(self, manifest_path):
+        """
+        Execute a manifest written in plan mode: move and strip every planned
+        image on the file stage threads, one destination folder at a time.
+        Images that are gone or were modified since planning are skipped.
+        Returns: the stats of the run
+        """
+        _, entries = read_plan(manifest_path)
+        self.prepare_folder()
+        
+        # Grouped by destination, so each category folder is filled in one go
+        entries.sort(key=lambda entry: (entry.get('category', ''), entry['path']))
+        self.total_images = len(entries)
+        self.start_time = time.time()
+        
+        self.file_stage = FileOpStage(self._handle_result, self.file_workers, self.file_queue_size)
+        try:
+            for entry in entries:
+                path = os.path.join(self.folder, *entry['path'].split('/'))
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                if (st is None or entry.get('category') not in self.categories or
+                        st.st_size != entry.get('size') or st.st_mtime_ns != entry.get('mtime_ns')):
+                    with self.progress_lock:
+                        self.skipped_images += 1
+                    continue
+                
+                result = dict(entry, path=path, filename=os.path.basename(path), cached=None)
+                if self.analysis_cache:
+                    self.analysis_cache.store(path, result)
+                self.file_stage.submit(result)
+        finally:
+            self.file_stage.close()
+        self.elapsed = time.time() - self.start_time
+        if self.analysis_cache:
+            self.analysis_cache.commit()
+        
+        return self.stats()
+    
+    def close(self):
+        """Commit and close the analysis cache"""
+        if self.analysis_cache:
+            self.analysis_cache.close()
+            self.analysis_cache = None
+    
+    def stats(self):
+        """Return a summary of the finished run"""
+        return {
+            'total': self.total_images,
+            'processed': self.processed_images,
+            'cached': self.cached_images,
+            'library': self.library_images,
+            'skipped': self.skipped_images,
+            'errors': self.errors,
+            'categories': dict(self.category_counts),
+            'stages': self.stage_timer.summary(),
+            'elapsed': self.elapsed,
+            'images_per_second': self.processed_images / self.elapsed if self.elapsed else 0.0
+        }
+
+
+def format_duration(seconds):
+    """Format seconds as HH:MM:SS"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+def run_headless(args):
+    """Run the scan pipeline (or its plan / apply half) from the command line and print throughput"""
+    if args.apply and not args.folder:
+        # Without a folder the plan is applied where it was made
+        try:
+            with open(args.apply, 'r', encoding='utf-8') as f:
+                args.folder = read_plan_header(f)['folder']
+        except (OSError, ValueError) as e:
+            print(f"Error reading plan: {e}")
+            return 1
+    if not os.path.isdir(args.folder):
+        print(f"Folder not found: {args.folder}")
+        return 1
+    
+    engine = ScanEngine(args.folder, workers=args.workers, in_flight_per_worker=args.in_flight,
+                        use_cache=not args.no_cache, incremental=args.incremental, recursive=args.recursive,
+                        file_workers=args.file_workers, plan_path=args.plan, thumbnails=args.thumbnails)
+    if args.apply:
+        return apply_headless(engine, args.apply)
+    
+    if args.plan:
+        print(f"Planning {args.folder} with {engine.num_cores} worker processes, writing {args.plan}")
+    else:
+        print(f"Processing {args.folder} with {engine.num_cores} worker processes and {engine.file_workers} file threads")
+    try:
+        stats = engine.run()
+    finally:
+        engine.close()
+    if not stats['total']:
+        print("No images found in this folder")
+        return 0
+    if engine.incremental:
+        print(f"Checked for duplicates against {stats['library']} library images")
+    
+    print(f"{'Classified' if args.plan else 'Processed'} {stats['processed']} of {stats['total']} images in {format_duration(stats['elapsed'])}")
+    print("  " + "  ".join(f"{name}: {count}" for name, count in stats['categories'].items()))
+    if stats['cached']:
+        print(f"  From analysis cache: {stats['cached']}")
+    if stats['errors']:
+        print(f"  Errors: {stats['errors']}")
+    print(f"Throughput: {stats['images_per_second']:.1f} images/s")
+    if args.plan:
+        print(f"Plan written to {args.plan} (no files were moved; run with --apply to execute it)")
+        # The scanned folder stays untouched, so the timings go next to the manifest
+        save_headless_summary(engine, stats, 'plan', os.path.dirname(os.path.abspath(args.plan)))
+    else:
+        save_headless_summary(engine, stats, 'process', engine.folder)
+    return 0
+
+
+def apply_headless(engine, manifest_path):
+    """Execute a plan manifest from the command line and print throughput"""
+    print(f"Applying {manifest_path} to {engine.folder} with {engine.file_workers} file threads")
+    try:
+        stats = engine.apply_plan(manifest_path)
+    except (OSError, ValueError) as e:
+        print(f"Error reading plan: {e}")
+        return 1
+    finally:
+        engine.close()
+    
+    print(f"Moved {stats['processed']} of {stats['total']} planned images in {format_duration(stats['elapsed'])}")
+    print("  " + "  ".join(f"{name}: {count}" for name, count in stats['categories'].items()))
+    if stats['skipped']:
+        print(f"  Skipped (missing or changed since planning): {stats['skipped']}")
+    if stats['errors']:
+        print(f"  Errors: {stats['errors']}")
+    print(f"Throughput: {stats['images_per_second']:.1f} images/s")
+    save_headless_summary(engine, stats, 'apply', engine.folder)
+    return 0
+
+
+def save_headless_summary(engine, stats, mode, summary_folder):
+    """Print the per-stage timings of a headless run and save them with write_run_summary()"""
+    if not stats['stages']:
+        return
+    print("Stage timings:")
+    for line in format_stage_table(stats['stages']):
+        print(line)
+    
+    summary = build_run_summary(
+        engine.folder, engine.start_time, stats['elapsed'], stats['processed'], stats['total'],
+        stats['categories'], engine.num_cores, engine.stage_timer,
+        mode=mode, file_workers=engine.file_workers, cached=stats['cached'], skipped=stats['skipped'], errors=stats['errors']
+    )
+    summary_path = write_run_summary(summary_folder, summary)
+    if summary_path:
+        print(f"Timings saved to {summary_path}")
+
+
+def main(argv=None):
+    """Open the GUI, or run headless when a folder is given on the command line"""
+    parser = argparse.ArgumentParser(description="BorderDetect & Metadata - border, duplicate and metadata cleaner")
+    parser.add_argument('folder', nargs='?', help="folder to process headless (omit to open the GUI)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count - 1)")
+    parser.add_argument('--in-flight', type=int, default=IN_FLIGHT_PER_WORKER, help="tasks kept in flight per worker (default: %(default)s)")
+    parser.add_argument('--file-workers', type=int, default=FILE_WORKERS, help="threads moving files and removing metadata (default: %(default)s)")
+    parser.add_argument('--recursive', action='store_true', help="also process images in subfolders (category folders are skipped)")
+    parser.add_argument('--incremental', action='store_true', help="also check new files for duplicates against the images already in the category folders")
+    parser.add_argument('--no-cache', action='store_true', help=f"don't read or write the folder's analysis cache ({CACHE_FILENAME})")
+    parser.add_argument('--thumbnails', action='store_true', help="also store the gallery thumbnails in the analysis cache, so the GUI opens the categories without decoding")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--plan', metavar='MANIFEST', help="only classify: write the verdicts to a JSONL manifest and leave the folder untouched")
+    mode.add_argument('--apply', metavar='MANIFEST', help="move and clean the files as planned in a manifest (folder defaults to the one planned)")
+    args = parser.parse_args(argv)
+    
+    if args.folder or args.apply:
+        return run_headless(args)
+    
+    # Create main window
+    root = ttk.Window(themename="darkly")
+    
+    # สร้างแอปพลิเคชัน
+    app = AdobeStockChecker(root)
+    
+    # แสดงหน้าต่าง
+    root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    # Required for multiprocessing support in compiled (.exe) Windows apps
+    multiprocessing.freeze_support()
+    
+    sys.exit(main())